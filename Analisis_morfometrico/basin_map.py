@@ -0,0 +1,96 @@
+import argparse, sys
+import pandas as pd
+import geopandas as gpd
+import shapely
+import folium
+
+# Mapa de resultados con pocas capas: todas las cuencas en una sola FeatureCollection y todos los
+# tramos principales (camino más largo de RiverNetwork, fusionado en una línea por cuenca) en
+# otra, en lugar de un folium.GeoJson por cuenca y otro por segmento. Las geometrías se
+# simplifican y se redondean a una grilla fija antes de serializarlas, y los tooltips salen de
+# los atributos de cada feature (GeoJsonTooltip), así que el HTML crece con los vértices
+# simplificados y no con el número de capas.
+TOOLTIP = [
+    ("HYBAS_ID", "HYBAS_ID"),
+    ("area_km2", "Área (km²)"),
+    ("perimetro_km", "Perímetro (km)"),
+    ("factor_forma", "Factor de forma"),
+    ("pendiente_media", "Pendiente media (%)"),
+    ("pendiente_min", "Pendiente mínima (%)"),
+    ("pendiente_max", "Pendiente máxima (%)"),
+    ("tiempo_concentracion_hr", "Tiempo de concentración (hr)"),
+    ("coef_compacidad", "Coeficiente de compacidad"),
+    ("radio_circularidad", "Radio de circularidad"),
+    ("Longest_Path_km", "Tramo principal (km)"),
+]
+
+def _compact(geoms, tolerance, grid):
+    # Simplificación (en grados, las capas están en EPSG:4326) y redondeo de coordenadas
+    if tolerance:
+        geoms = shapely.simplify(geoms, tolerance, preserve_topology=True)
+    return shapely.set_precision(geoms, grid) if grid else geoms
+
+def main_stems(cuencas, red, id_col="HYBAS_ID"):
+    # Un registro por cuenca con el camino más largo fusionado en una (multi)línea
+    rows = []
+    for bid, geom in zip(cuencas[id_col], cuencas.geometry):
+        _, length, segments = red.basin_longest_path(bid, geom)
+        if len(segments):
+            line = shapely.line_merge(shapely.union_all(red.geometries(segments)))
+            rows.append({id_col: bid, "Longest_Path_km": round(length, 2), "geometry": line})
+    return gpd.GeoDataFrame(rows, columns=[id_col, "Longest_Path_km", "geometry"], geometry="geometry", crs=red.rios.crs)
+
+def basin_layers(cuencas, red=None, metricas=None, tolerance=0.0005, grid=1e-5, id_col="HYBAS_ID"):
+    # (cuencas, tramos) listos para el mapa: EPSG:4326, geometrías compactas y solo las columnas del tooltip
+    cuencas = cuencas.to_crs(4326)
+    if metricas is not None:
+        cuencas = cuencas[[id_col, "geometry"]].merge(pd.DataFrame(metricas).drop(columns="geometry", errors="ignore"), on=id_col, how="left")
+    tramos = main_stems(cuencas, red, id_col).to_crs(4326) if red is not None else None
+    if tramos is not None and "Longest_Path_km" not in cuencas:
+        cuencas = cuencas.merge(tramos[[id_col, "Longest_Path_km"]], on=id_col, how="left")
+    fields = [c for c, _ in TOOLTIP if c in cuencas.columns]
+    cuencas = gpd.GeoDataFrame(cuencas[fields], geometry=_compact(cuencas.geometry.values, tolerance, grid), crs=4326)
+    if tramos is not None:
+        tramos = tramos.set_geometry(_compact(tramos.geometry.values, tolerance / 2, grid))
+    return cuencas, tramos
+
+def basin_map(cuencas, red=None, metricas=None, tolerance=0.0005, grid=1e-5, id_col="HYBAS_ID", tiles="CartoDB positron"):
+    cuencas, tramos = basin_layers(cuencas, red, metricas, tolerance, grid, id_col)
+    minx, miny, maxx, maxy = cuencas.total_bounds
+    mapa = folium.Map(location=[(miny + maxy) / 2, (minx + maxx) / 2], tiles=tiles)
+    mapa.fit_bounds([[miny, minx], [maxy, maxx]])
+    aliases = dict(TOOLTIP)
+    fields = [c for c in cuencas.columns if c != "geometry"]
+    folium.GeoJson(
+        cuencas, name="Cuencas",
+        style_function=lambda x: {"color": "blue", "weight": 1, "fillOpacity": 0.1},
+        highlight_function=lambda x: {"weight": 3, "fillOpacity": 0.3},
+        tooltip=folium.GeoJsonTooltip(fields=fields, aliases=[aliases[f] for f in fields], localize=True),
+    ).add_to(mapa)
+    if tramos is not None and len(tramos):
+        folium.GeoJson(
+            tramos, name="Tramos principales",
+            style_function=lambda x: {"color": "red", "weight": 3},
+            tooltip=folium.GeoJsonTooltip(fields=[id_col, "Longest_Path_km"], aliases=[id_col, aliases["Longest_Path_km"]]),
+        ).add_to(mapa)
+    folium.LayerControl().add_to(mapa)
+    return mapa
+
+def main(argv=None):
+    from river_network import RiverNetwork
+    p = argparse.ArgumentParser(description="Mapa HTML de cuencas, métricas y tramos principales.")
+    p.add_argument("cuencas", help="Capa de cuencas con HYBAS_ID")
+    p.add_argument("-m", "--metricas", help="CSV de métricas (basin_metrics_with_network.csv)")
+    p.add_argument("--rios", help="Red HydroRIVERS para dibujar los tramos principales")
+    p.add_argument("--tolerance", type=float, default=0.0005, help="Tolerancia de simplificación en grados")
+    p.add_argument("-o", "--output", default="mapa_cuencas.html")
+    args = p.parse_args(argv)
+    cuencas = gpd.read_file(args.cuencas)
+    metricas = pd.read_csv(args.metricas, encoding="utf-8-sig") if args.metricas else None
+    red = RiverNetwork(gpd.read_file(args.rios).to_crs(cuencas.crs)) if args.rios else None
+    basin_map(cuencas, red, metricas, args.tolerance).save(args.output)
+    print(f"{len(cuencas)} cuencas -> {args.output}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
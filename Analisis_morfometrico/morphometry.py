@@ -0,0 +1,163 @@
+import argparse, math, os, sys
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+import geopandas as gpd
+import rasterio
+from rasterio.features import rasterize
+from rasterio.windows import Window, transform as window_transform
+from shapely.geometry import box
+from river_network import RiverNetwork
+
+# Motor local (sin Earth Engine) para las métricas de calcular_metricas en morph_analysis.ipynb.
+# Produce las mismas columnas que basin_metrics_with_network.csv a partir de una capa de
+# cuencas y un DEM GeoTIFF local:
+#   - área, perímetro y centroide, vectorizados en una proyección acimutal de igual área
+#     (LAEA) centrada en las cuencas; los índices de forma se derivan de los valores redondeados
+#     a dos decimales, igual que en el notebook;
+#   - pendiente (grados, como ee.Terrain.slope, con vecinos 4-conectados) leyendo el DEM por
+#     ventanas con un píxel de borde; cada ventana rasteriza una sola vez las etiquetas de las
+#     cuencas que la tocan y acumula suma/conteo/mín/máx por etiqueta. Las ventanas se reparten
+#     entre procesos y la memoria queda acotada por el tamaño de ventana.
+def redondear_a_dos_decimales(x):
+    # ee.Number.round redondea las mitades alejándose de cero
+    x = np.asarray(x, dtype=float)
+    return np.sign(x) * np.floor(np.abs(x) * 100 + 0.5) / 100
+
+def geometry_metrics(cuencas):
+    ll = cuencas.geometry.to_crs(4326)
+    lon0, lat0 = ll.union_all().centroid.coords[0]
+    laea = f"+proj=laea +lat_0={lat0} +lon_0={lon0} +datum=WGS84 +units=m +no_defs"
+    g = ll.to_crs(laea)
+    area = redondear_a_dos_decimales(g.area.values / 1e6)
+    perimetro = redondear_a_dos_decimales(g.length.values / 1000)
+    centroide = g.centroid.to_crs(4326)
+    return pd.DataFrame({
+        "area_km2": area,
+        "perimetro_km": perimetro,
+        "factor_forma": redondear_a_dos_decimales(perimetro**2 / (area * 4 * np.pi)),
+        "coef_compacidad": redondear_a_dos_decimales(0.282 * perimetro / np.sqrt(area)),
+        "radio_circularidad": redondear_a_dos_decimales(4 * np.pi * area / perimetro**2),
+        "tiempo_concentracion_hr": redondear_a_dos_decimales(0.01947 * area**0.385 * perimetro**0.15),
+        "centroide_x": centroide.x.values,
+        "centroide_y": centroide.y.values,
+    }, index=cuencas.index)
+
+def _pixel_size_m(transform, rows, geographic):
+    # Tamaño del píxel en metros para cada fila; en DEM geográficos depende de la latitud
+    rx, ry = abs(transform.a), abs(transform.e)
+    if not geographic:
+        return np.full(len(rows), rx), np.full(len(rows), ry)
+    lat = np.radians(transform.f + (rows + 0.5) * transform.e)
+    m_lat = 111132.954 - 559.822 * np.cos(2 * lat) + 1.175 * np.cos(4 * lat)
+    m_lon = 111412.84 * np.cos(lat) - 93.5 * np.cos(3 * lat)
+    return rx * m_lon, ry * m_lat
+
+def slope_degrees(z, transform, row_off, geographic):
+    # z incluye un píxel de borde; devuelve la pendiente del interior (NaN donde falta algún vecino)
+    dx, dy = _pixel_size_m(transform, np.arange(row_off, row_off + z.shape[0] - 2), geographic)
+    gx = (z[1:-1, 2:] - z[1:-1, :-2]) / (2 * dx[:, None])
+    gy = (z[2:, 1:-1] - z[:-2, 1:-1]) / (2 * dy[:, None])
+    return np.degrees(np.arctan(np.hypot(gx, gy)))
+
+def _tile_stats(job):
+    dem_path, (col, row, w, h), shapes = job
+    with rasterio.open(dem_path) as src:
+        z = src.read(1, window=Window(col - 1, row - 1, w + 2, h + 2), boundless=True, masked=True)
+        z = z.astype(float).filled(np.nan)
+        labels = rasterize(shapes, out_shape=(h, w), transform=window_transform(Window(col, row, w, h), src.transform),
+                           fill=0, dtype="int32")
+        slope = slope_degrees(z, src.transform, row, src.crs is not None and src.crs.is_geographic)
+    ok = (labels > 0) & np.isfinite(slope)
+    lab, s = labels[ok], slope[ok]
+    if not len(lab):
+        return None
+    ids, inv = np.unique(lab, return_inverse=True)
+    mn, mx = np.full(len(ids), np.inf), np.full(len(ids), -np.inf)
+    np.minimum.at(mn, inv, s)
+    np.maximum.at(mx, inv, s)
+    return ids, np.bincount(inv, s), np.bincount(inv), mn, mx
+
+def pixel_extent(bounds, transform, width, height):
+    # Ventana entera que cubre bounds: origen hacia abajo y borde lejano hacia arriba (round_lengths
+    # trunca el ancho y el alto y puede dejar fuera la última columna y fila), recortada al ráster
+    w = rasterio.windows.from_bounds(*bounds, transform=transform)
+    col0, row0 = math.floor(w.col_off), math.floor(w.row_off)
+    col1, row1 = math.ceil(w.col_off + w.width), math.ceil(w.row_off + w.height)
+    return Window(col0, row0, col1 - col0, row1 - row0).intersection(Window(0, 0, width, height))
+
+def tile_windows(bounds_window, width, height, tile):
+    row0, col0 = int(bounds_window.row_off), int(bounds_window.col_off)
+    for row in range(row0, int(row0 + bounds_window.height), tile):
+        for col in range(col0, int(col0 + bounds_window.width), tile):
+            yield col, row, min(tile, width - col), min(tile, height - row)
+
+def slope_stats(cuencas, dem_path, tile=1024, workers=None):
+    # Suma, conteo, mínimo y máximo de la pendiente por cuenca, en una sola pasada por ventanas
+    with rasterio.open(dem_path) as src:
+        g = cuencas.geometry.to_crs(src.crs)
+        transform, width, height = src.transform, src.width, src.height
+        area = pixel_extent(g.total_bounds, transform, width, height)
+    n = len(g)
+    labels = np.arange(1, n + 1)
+    jobs = []
+    for col, row, w, h in tile_windows(area, width, height, tile):
+        hit = g.sindex.query(box(*rasterio.windows.bounds(Window(col, row, w, h), transform)))
+        if len(hit):
+            jobs.append((dem_path, (col, row, w, h), list(zip(g.values[hit], labels[hit]))))
+    total, count = np.zeros(n + 1), np.zeros(n + 1)
+    mn, mx = np.full(n + 1, np.inf), np.full(n + 1, -np.inf)
+    workers = workers or os.cpu_count() or 1
+    if workers > 1 and len(jobs) > 1:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            for res in pool.map(_tile_stats, jobs):
+                _merge(res, total, count, mn, mx)
+    else:
+        for job in jobs:
+            _merge(_tile_stats(job), total, count, mn, mx)
+    empty = count == 0
+    count[empty] = np.nan
+    mn[empty], mx[empty] = np.nan, np.nan
+    return pd.DataFrame({"pendiente_media": redondear_a_dos_decimales(total[1:] / count[1:]),
+                         "pendiente_min": redondear_a_dos_decimales(mn[1:]),
+                         "pendiente_max": redondear_a_dos_decimales(mx[1:])}, index=cuencas.index)
+
+def _merge(res, total, count, mn, mx):
+    if res is None:
+        return
+    ids, s, c, lo, hi = res
+    total[ids] += s
+    count[ids] += c
+    mn[ids] = np.minimum(mn[ids], lo)
+    mx[ids] = np.maximum(mx[ids], hi)
+
+def calcular_metricas(cuencas, dem_path, rios=None, tile=1024, workers=None):
+    # cuencas: GeoDataFrame con HYBAS_ID (y el resto de atributos de HydroBASINS); rios: GeoDataFrame
+    # de HydroRIVERS opcional para Longest_Path_km. Columnas ordenadas como las exporta Earth Engine.
+    cuencas = cuencas.reset_index(drop=True)
+    metricas = geometry_metrics(cuencas).join(slope_stats(cuencas, dem_path, tile, workers))
+    df = pd.concat([pd.DataFrame(cuencas.drop(columns=cuencas.geometry.name)), metricas], axis=1)
+    df = df[sorted(df.columns)]
+    if rios is not None:
+        red = RiverNetwork(rios.to_crs(cuencas.crs))
+        df["Longest_Path_km"] = [red.basin_longest_path(bid, geom)[1] for bid, geom in zip(cuencas["HYBAS_ID"], cuencas.geometry)]
+    return df
+
+def main(argv=None):
+    p = argparse.ArgumentParser(description="Métricas morfométricas de cuencas a partir de un DEM local.")
+    p.add_argument("cuencas", help="Capa de cuencas (shapefile, GPKG o GeoJSON) con HYBAS_ID")
+    p.add_argument("dem", help="DEM GeoTIFF (p. ej. SRTM 90 m)")
+    p.add_argument("-o", "--output", default="basin_metrics_local.csv")
+    p.add_argument("--rios", help="Red HydroRIVERS (GeoJSON/GPKG) para calcular Longest_Path_km")
+    p.add_argument("--tile", type=int, default=1024, help="Tamaño de ventana del DEM en píxeles")
+    p.add_argument("-j", "--workers", type=int, default=None)
+    args = p.parse_args(argv)
+    cuencas = gpd.read_file(args.cuencas)
+    rios = gpd.read_file(args.rios) if args.rios else None
+    df = calcular_metricas(cuencas, args.dem, rios, args.tile, args.workers)
+    df.to_csv(args.output, index=False, encoding="utf-8-sig")
+    print(f"{len(df)} cuencas -> {args.output}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,88 @@
+from collections import deque
+import numpy as np
+import pandas as pd
+
+# Índice de la red fluvial HydroRIVERS construido una sola vez sobre toda la tabla de ríos.
+# Cada segmento es una arista NOID -> NDOID con peso LENGTH_KM; los nodos se renumeran a
+# enteros consecutivos, la adyacencia se guarda en arreglos tipo CSR y el orden topológico
+# global se calcula una vez. El camino más largo de una cuenca sale de una pasada de
+# programación dinámica sobre sus segmentos en ese orden, y se memoriza por cuenca para que
+# las celdas de métricas y de mapa no lo recalculen.
+class RiverNetwork:
+    def __init__(self, rios_df, id_col="NOID", down_col="NDOID", length_col="LENGTH_KM"):
+        self.rios = rios_df.reset_index(drop=True)
+        noid = self.rios[id_col].to_numpy()
+        ndoid = self.rios[down_col].to_numpy()
+        n = len(self.rios)
+        self.node_ids, inv = np.unique(np.concatenate([noid, ndoid]), return_inverse=True)
+        self.src, self.dst = inv[:n], inv[n:]
+        self.length = self.rios[length_col].to_numpy(dtype=float)
+        # NOID -> fila del segmento (primera aparición), sin recorrer la tabla por arista
+        self.segment_of = pd.Series(np.arange(n), index=noid)
+        self.segment_of = self.segment_of[~self.segment_of.index.duplicated()]
+        order = np.argsort(self.src, kind="mergesort")
+        self.out_edges = order
+        self.out_ptr = np.concatenate([[0], np.cumsum(np.bincount(self.src, minlength=len(self.node_ids)))])
+        self.rank = self._topological_rank()
+        self._memo = {}
+
+    def _topological_rank(self):
+        # Kahn sobre la adyacencia CSR; posición de cada nodo en el orden topológico global
+        indeg = np.bincount(self.dst, minlength=len(self.node_ids))
+        queue = deque(np.nonzero(indeg == 0)[0].tolist())
+        rank = np.full(len(self.node_ids), -1, dtype=np.int64)
+        k = 0
+        while queue:
+            u = queue.popleft()
+            rank[u] = k
+            k += 1
+            for e in self.out_edges[self.out_ptr[u]:self.out_ptr[u + 1]]:
+                v = self.dst[e]
+                indeg[v] -= 1
+                if indeg[v] == 0:
+                    queue.append(v)
+        if k < len(self.node_ids):
+            raise ValueError("La red fluvial contiene ciclos (NOID -> NDOID)")
+        return rank
+
+    def segments_in(self, geom):
+        # Filas de los segmentos que intersectan la geometría (mismo criterio que geometry.intersects)
+        return np.sort(self.rios.sindex.query(geom, predicate="intersects"))
+
+    def longest_path(self, segments):
+        # Devuelve (NOIDs del camino, longitud total, filas de los segmentos recorridos)
+        segments = np.asarray(segments, dtype=np.int64)
+        if len(segments) == 0:
+            return [], 0, segments
+        segments = segments[np.argsort(self.rank[self.src[segments]], kind="mergesort")]
+        nodes, local = np.unique(np.concatenate([self.src[segments], self.dst[segments]]), return_inverse=True)
+        ls, ld = local[:len(segments)], local[len(segments):]
+        dist = np.zeros(len(nodes))
+        best_in = np.full(len(nodes), -1, dtype=np.int64)
+        for i, (u, v, w) in enumerate(zip(ls, ld, self.length[segments])):
+            if dist[u] + w > dist[v]:
+                dist[v] = dist[u] + w
+                best_in[v] = i
+        # Como nx.dag_longest_path: termina en el primer nodo, en orden topológico, de máxima distancia
+        by_rank = np.argsort(self.rank[nodes], kind="mergesort")
+        end = by_rank[np.argmax(dist[by_rank])]
+        path_edges = []
+        v = end
+        while best_in[v] >= 0:
+            path_edges.append(best_in[v])
+            v = ls[best_in[v]]
+        path_edges = path_edges[::-1]
+        path = [nodes[v]] + [nodes[ld[i]] for i in path_edges]
+        return [self.node_ids[p] for p in path], float(dist[end]), segments[path_edges]
+
+    def basin_longest_path(self, basin_id, geom):
+        # Memorizado por cuenca: la segunda llamada (p. ej. desde el mapa) no repite el cálculo
+        if basin_id not in self._memo:
+            self._memo[basin_id] = self.longest_path(self.segments_in(geom))
+        return self._memo[basin_id]
+
+    def segment(self, noid):
+        return self.rios.iloc[self.segment_of[noid]]
+
+    def geometries(self, segments):
+        return self.rios.geometry.values[np.asarray(segments, dtype=np.int64)]
@@ -0,0 +1,214 @@
+import argparse, os, sys, time
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+import geopandas as gpd
+import shapely
+
+# Motor vectorizado para elegir el cauce principal de cada cuenca (misma regla que
+# Cauce_principal.ipynb): entre los ríos de menor ORD_CLAS que tocan la cuenca gana el de
+# mayor DIS_AV_CMS y, a igualdad, el de mayor longitud dentro de la cuenca.
+# En lugar de filtrar/recortar/agrupar cuenca por cuenca se hace un solo emparejamiento
+# ríos–cuencas, un recorte por pares repartido entre procesos, una sola agregación
+# (BASIN_ID, MAIN_RIV) y un ranking vectorizado; solo se disuelve la geometría elegida.
+# stream_main_rivers recorre las cuencas en bloques espacialmente contiguos, lee solo los
+# ríos de cada bloque y va agregando los resultados al GPKG/CSV, con memoria acotada.
+RIVER_COLS = ["MAIN_RIV", "ORD_CLAS", "DIS_AV_CMS"]
+TAG_COLS = ["BASIN_ID", *RIVER_COLS, "geometry"]
+OUT_COLS = ["BASIN_ID", "MAIN_RIV", "len_km_in_basin", "dis_av_cms", "ord_clas_min_basin", "geometry"]
+TABLE_COLS = ["BASIN_ID", "MAIN_RIV", "len_km_in_basin", "dis_av_cms", "ord_clas_elegido", "modo"]
+MIN_PARALLEL = 2000  # por debajo de este número de geometrías no compensa lanzar procesos
+# El STRtree se consulta con las cuencas, así que el predicado río→cuenca se invierte
+INVERSE_PREDICATE = {"intersects": "intersects", "touches": "touches", "crosses": "crosses", "overlaps": "overlaps",
+                     "within": "contains", "contains": "within", "covered_by": "covers", "covers": "covered_by"}
+
+def read_basins(basins_path, basin_layer=None, target_epsg=4326, simplify_tolerance_m=0, encoding="latin1"):
+    b = gpd.read_file(basins_path, layer=basin_layer, encoding=encoding)
+    if b.crs is None:
+        raise ValueError("basins sin CRS")
+    b = b.to_crs(target_epsg)
+    if "BASIN_ID" not in b:
+        b = b.reset_index(drop=False).rename(columns={"index": "BASIN_ID"})
+    b = b[["BASIN_ID", "geometry"]]
+    if simplify_tolerance_m > 0:
+        b["geometry"] = b.geometry.simplify(simplify_tolerance_m, preserve_topology=True)
+    return b
+
+def read_rivers(rivers_path, river_layer=None, target_epsg=4326, bbox=None):
+    # bbox: GeoSeries/GeoDataFrame (se reproyecta al CRS del archivo) para leer solo una zona
+    r = gpd.read_file(rivers_path, layer=river_layer, bbox=bbox)
+    if r.crs is None:
+        raise ValueError("rivers sin CRS")
+    r = r.to_crs(target_epsg)
+    missing = [c for c in ["MAIN_RIV", "ORD_CLAS", "geometry"] if c not in r.columns]
+    if missing:
+        raise ValueError(f"Faltan columnas en ríos: {missing}")
+    if "DIS_AV_CMS" not in r:
+        r["DIS_AV_CMS"] = pd.NA
+    return r[[*RIVER_COLS, "geometry"]]
+
+def load_inputs(basins_path, rivers_path, basin_layer=None, river_layer=None, target_epsg=4326,
+                simplify_tolerance_m=0, encoding="latin1"):
+    return (read_basins(basins_path, basin_layer, target_epsg, simplify_tolerance_m, encoding),
+            read_rivers(rivers_path, river_layer, target_epsg))
+
+def tag_rivers(b, r, predicate="intersects"):
+    # Consulta masiva: todas las cuencas contra el STRtree de los ríos en una sola llamada,
+    # que devuelve los pares (cuenca, río); solo se copian una vez las filas emparejadas
+    ib, ir = r.sindex.query(b.geometry.values, predicate=INVERSE_PREDICATE[predicate])
+    tagged = r.iloc[ir].reset_index(drop=True)
+    tagged.insert(0, "BASIN_ID", b["BASIN_ID"].values[ib])
+    return tagged[TAG_COLS]
+
+def _shards(n, workers, per_worker=4):
+    size = max(1, -(-n // (max(workers, 1) * per_worker)))
+    return [slice(i, min(i + size, n)) for i in range(0, n, size)]
+
+def _map(fn, jobs, workers):
+    if workers <= 1 or len(jobs) <= 1:
+        return [fn(j) for j in jobs]
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        return list(pool.map(fn, jobs))
+
+def _intersect(job):
+    rivers, basins = job
+    return shapely.intersection(rivers, basins)
+
+def _union(groups):
+    return [shapely.union_all(g) for g in groups]
+
+def clip_candidates(cands, basin_geom, workers=1):
+    # Recorte por pares: cada segmento candidato contra el polígono de su propia cuenca
+    rivers = cands.geometry.values
+    basins = np.asarray(basin_geom.reindex(cands["BASIN_ID"]).values, dtype=object)
+    workers = workers if len(cands) >= MIN_PARALLEL else 1
+    parts = _map(_intersect, [(rivers[s], basins[s]) for s in _shards(len(cands), workers)], workers)
+    clipped = cands.set_geometry(np.concatenate(parts) if parts else rivers, crs=cands.crs)
+    clipped = clipped[~clipped.geometry.is_empty & clipped.geometry.notna()].copy()
+    clipped["len_km_in_basin"] = clipped.length / 1000
+    return clipped
+
+def choose_main_river(cands, clipped):
+    # Agregación única por (cuenca, río); las cuencas sin recorte usan la longitud total como el notebook
+    spec = dict(len_km_in_basin=("len_km_in_basin", "sum"), dis_av_cms=("DIS_AV_CMS", "mean"), ord_clas=("ORD_CLAS", "min"))
+    unclipped = cands[~cands["BASIN_ID"].isin(clipped["BASIN_ID"].unique())]
+    agg = pd.concat([clipped.groupby(["BASIN_ID", "MAIN_RIV"], as_index=False).agg(**spec),
+                     unclipped.assign(len_km_in_basin=unclipped["len_km_total"])
+                              .groupby(["BASIN_ID", "MAIN_RIV"], as_index=False).agg(**spec)], ignore_index=True)
+    agg["_Q"] = pd.to_numeric(agg["dis_av_cms"], errors="coerce").fillna(-1)
+    agg = agg.sort_values(["BASIN_ID", "_Q", "len_km_in_basin"], ascending=[True, False, False], kind="mergesort")
+    best = agg.drop_duplicates("BASIN_ID").drop(columns="_Q").reset_index(drop=True)
+    return best.assign(ord_clas_elegido=best["ord_clas"].astype(int), modo="auto_max_Q").drop(columns="ord_clas")
+
+def dissolve_selected(clipped, best, workers=1):
+    # Solo se unen las piezas del río elegido en cada cuenca, repartiendo los grupos entre procesos
+    sel = clipped.merge(best[["BASIN_ID", "MAIN_RIV"]], on=["BASIN_ID", "MAIN_RIV"])
+    if sel.empty:
+        return gpd.GeoDataFrame(columns=OUT_COLS, geometry="geometry", crs=clipped.crs)
+    sel = sel.sort_values("BASIN_ID", kind="mergesort")
+    keys, starts = np.unique(sel["BASIN_ID"].values, return_index=True)
+    groups = np.split(sel.geometry.values, starts[1:])
+    workers = workers if len(sel) >= MIN_PARALLEL else 1
+    geoms = sum(_map(_union, [groups[s] for s in _shards(len(groups), workers)], workers), [])
+    pg = best[best["BASIN_ID"].isin(keys)].set_index("BASIN_ID").loc[keys].reset_index()
+    pg = pg.rename(columns={"ord_clas_elegido": "ord_clas_min_basin"})
+    return gpd.GeoDataFrame(pg[OUT_COLS[:-1]], geometry=list(geoms), crs=clipped.crs)
+
+def main_rivers(b, r, predicate="intersects", workers=None, log=print, allow_empty=False):
+    # Devuelve (tabla por cuenca, GeoDataFrame con la geometría del cauce principal, tiempos)
+    workers = workers or os.cpu_count() or 1
+    times = {}
+    t = time.perf_counter()
+    tagged = tag_rivers(b, r, predicate)
+    times["t_join"] = time.perf_counter() - t
+    if tagged.empty:
+        if not allow_empty:
+            raise ValueError("No hay ríos que intersecten cuencas.")
+        return (pd.DataFrame(columns=TABLE_COLS), gpd.GeoDataFrame(columns=OUT_COLS, geometry="geometry", crs=b.crs), times)
+    log(f"sjoin listo: {len(tagged)} emparejamientos.")
+    cands = tagged[tagged["ORD_CLAS"] == tagged.groupby("BASIN_ID")["ORD_CLAS"].transform("min")].copy()
+    cands["len_km_total"] = cands.length / 1000
+    log(f"Candidatos (mín ORD por cuenca): {len(cands)} en {cands['BASIN_ID'].nunique()} cuencas")
+    basin_geom = pd.Series(b.geometry.values, index=b["BASIN_ID"].values)
+    t = time.perf_counter()
+    clipped = clip_candidates(cands, basin_geom, workers)
+    times["t_clip"] = time.perf_counter() - t
+    t = time.perf_counter()
+    best = choose_main_river(cands, clipped)
+    times["t_group"] = time.perf_counter() - t
+    t = time.perf_counter()
+    pg = dissolve_selected(clipped, best, workers)
+    times["t_dissolve"] = time.perf_counter() - t
+    log(" ".join(f"{k}={v:,.1f}s" for k, v in times.items()))
+    return best[TABLE_COLS], pg, times
+
+def write_outputs(tbl, pg, out_gpkg="principal_river_by_basin1.gpkg", out_layer="principal1",
+                  out_csv="principal1_river_lengths.csv"):
+    if os.path.exists(out_gpkg):
+        os.remove(out_gpkg)
+    pg.to_file(out_gpkg, layer=out_layer, driver="GPKG")
+    tbl.to_csv(out_csv, index=False)
+    return out_gpkg, out_csv
+
+def spatial_chunks(b, chunk_size):
+    # Bloques de cuencas contiguas en el espacio (orden de Hilbert de los centroides), para
+    # que cada bloque lea una zona compacta de la red de ríos
+    order = np.argsort(b.geometry.hilbert_distance(), kind="mergesort")
+    return [b.iloc[order[i:i + chunk_size]] for i in range(0, len(b), chunk_size)]
+
+def stream_main_rivers(b, rivers_path, out_gpkg="principal_river_by_basin1.gpkg", out_layer="principal1",
+                       out_csv="principal1_river_lengths.csv", chunk_size=500, river_layer=None, predicate="intersects",
+                       workers=None, log=print):
+    # Cada bloque lee solo los ríos de su envolvente, elige los cauces y se agrega al GPKG y al CSV;
+    # la memoria pico depende del tamaño del bloque y no del total de emparejamientos
+    for path in (out_gpkg, out_csv):
+        if os.path.exists(path):
+            os.remove(path)
+    chunks = spatial_chunks(b, chunk_size)
+    totals = {"basins": 0, "selected": 0, "rivers_read": 0}
+    t0 = time.perf_counter()
+    for k, chunk in enumerate(chunks, 1):
+        t = time.perf_counter()
+        env = gpd.GeoSeries([shapely.box(*chunk.total_bounds)], crs=b.crs)
+        r = read_rivers(rivers_path, river_layer, b.crs, bbox=env)
+        tbl, pg, times = main_rivers(chunk, r, predicate, workers, log=lambda msg: None, allow_empty=True)
+        if len(pg):
+            pg.to_file(out_gpkg, layer=out_layer, driver="GPKG", mode="a" if os.path.exists(out_gpkg) else "w")
+        if len(tbl):
+            tbl.to_csv(out_csv, mode="a", header=not os.path.exists(out_csv), index=False)
+        totals["basins"] += len(chunk)
+        totals["selected"] += len(tbl)
+        totals["rivers_read"] += len(r)
+        log(f"[bloque {k}/{len(chunks)}] {len(chunk)} cuencas, {len(r)} ríos leídos, {len(tbl)} cauces "
+            f"({time.perf_counter() - t:,.1f}s; acumulado {totals['selected']}/{totals['basins']} "
+            f"en {time.perf_counter() - t0:,.1f}s)")
+    return totals
+
+def main(argv=None):
+    p = argparse.ArgumentParser(description="Cauce principal por cuenca (motor vectorizado).")
+    p.add_argument("basins", help="Shapefile/GPKG de cuencas")
+    p.add_argument("rivers", help="GPKG de ríos con MAIN_RIV, ORD_CLAS y DIS_AV_CMS")
+    p.add_argument("--out-gpkg", default="principal_river_by_basin1.gpkg")
+    p.add_argument("--out-layer", default="principal1")
+    p.add_argument("--out-csv", default="principal1_river_lengths.csv")
+    p.add_argument("--epsg", type=int, default=4326)
+    p.add_argument("--simplify", type=float, default=0, help="Tolerancia de simplificación de cuencas")
+    p.add_argument("--predicate", default="intersects")
+    p.add_argument("-j", "--workers", type=int, default=None, help="Procesos para recorte y disolución")
+    p.add_argument("--chunk-size", type=int, default=0,
+                   help="Procesar por bloques de N cuencas y escribir cada bloque al terminarlo (0 = todo de una vez)")
+    args = p.parse_args(argv)
+    if args.chunk_size > 0:
+        b = read_basins(args.basins, target_epsg=args.epsg, simplify_tolerance_m=args.simplify)
+        totals = stream_main_rivers(b, args.rivers, args.out_gpkg, args.out_layer, args.out_csv, args.chunk_size,
+                                    predicate=args.predicate, workers=args.workers)
+        print(f"{totals['selected']} cuencas -> {args.out_gpkg}, {args.out_csv}")
+        return 0
+    b, r = load_inputs(args.basins, args.rivers, target_epsg=args.epsg, simplify_tolerance_m=args.simplify)
+    tbl, pg, _ = main_rivers(b, r, args.predicate, args.workers)
+    write_outputs(tbl, pg, args.out_gpkg, args.out_layer, args.out_csv)
+    print(f"{len(tbl)} cuencas -> {args.out_gpkg}, {args.out_csv}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
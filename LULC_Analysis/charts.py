@@ -0,0 +1,143 @@
+import argparse, html, os, sys
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+
+# Exportación por lotes, sin pantalla, de los gráficos de cambio de cobertura por cuenca del
+# notebook (un gráfico de barras horizontales por HYBAS_ID). Cada proceso arma una sola vez una
+# plantilla (figura Agg, ejes, línea del cero, márgenes y un juego de barras y etiquetas) y para
+# cada cuenca solo cambia anchos, colores, textos y límites antes de guardar; las cuencas se
+# reparten en lotes entre procesos. Además escribe un informe HTML con todas las figuras.
+COLOR_MAP = {
+    "1.1. Bosque": "#1f8d49", "1.2. Bosque abierto": "#7dc975", "1.3. Manglar": "#04381d", "1.4. Bosque inundable": "#026975",
+    "2.2. Herbazal": "#d6bc74", "2.1. Formación natural no forestal inundable": "#519799", "2.3. Afloramiento rocoso": "#ffaa5f",
+    "2.4. Otra formación natural no forestal": "#d89f5c", "3.3 Silvicultura": "#7a5900", "3.5 Mosaico de agricultura y/o pastos": "#ffefc3",
+    "4.2. Infraestructura urbana": "#d4271e", "4.3. Minería": "#9c0027", "4.4. Otra área natural sin vegetación": "#e97a7a",
+    "4.5. Otra área antrópica sin vegetación": "#db4d4f", "5.1 Río, lago u océano": "#2532e4", "5.2 Glaciar": "#93dfe6", "5.3 Acuicultura": "#091077"
+}
+
+class ChangeChart:
+    # Plantilla reutilizable del gráfico de barras de cambio porcentual por clase
+    def __init__(self, classes, year_a, year_b, figsize=(12, 6), dpi=100, color_map=COLOR_MAP):
+        self.color_map = color_map
+        self.years = (year_a, year_b)
+        self.fig = Figure(figsize=figsize, dpi=dpi)
+        FigureCanvasAgg(self.fig)
+        self.ax = self.fig.add_subplot()
+        n = max(len(classes), 1)
+        self.bars = self.ax.barh(np.arange(n), np.zeros(n), edgecolor="black").patches
+        self.labels = [self.ax.text(0, i, "", va="center", fontsize=9, color="black") for i in range(n)]
+        self.ax.axvline(0, color="red", linestyle="--")
+        self.ax.set_xlabel(f"Cambio total en porcentaje ({year_a}–{year_b})")
+        self.ax.set_ylabel("Clase de cobertura")
+        # Márgenes calculados una vez con las etiquetas más largas posibles y luego fijos
+        self.ax.set_yticks(np.arange(n), classes or [""])
+        self.ax.set_title(" ")
+        self.fig.tight_layout()
+        self.fig.set_layout_engine("none")
+
+    def draw(self, classes, values, title):
+        n = len(classes)
+        order = np.argsort(-np.asarray(values, dtype=float), kind="mergesort")
+        classes, values = [classes[i] for i in order], np.asarray(values, dtype=float)[order]
+        xmin, xmax = (float(values.min()), float(values.max())) if n else (0.0, 0.0)
+        xrange = xmax - xmin if xmax != xmin else (abs(xmax) if xmax != 0 else 1.0)
+        padding = 0.03 * xrange
+        for i, (bar, text) in enumerate(zip(self.bars, self.labels)):
+            visible = i < n
+            bar.set_visible(visible)
+            text.set_visible(visible)
+            if not visible:
+                continue
+            width = values[i]
+            bar.set_width(width)
+            bar.set_facecolor(self.color_map.get(classes[i], "#000000"))
+            text.set_position((width + (padding if width >= 0 else -padding), i))
+            text.set_text(f"{width:.2f}%")
+            text.set_horizontalalignment("left" if width >= 0 else "right")
+        self.ax.set_yticks(np.arange(n), classes)
+        self.ax.set_ylim(n - 0.5, -0.5)
+        self.ax.set_xlim(xmin - 3 * padding, xmax + 3 * padding)
+        self.ax.set_title(title)
+
+    def save(self, path):
+        self.fig.savefig(path)
+        return path
+
+_chart = None
+
+def _init_worker(classes, year_a, year_b, figsize, dpi):
+    global _chart
+    _chart = ChangeChart(classes, year_a, year_b, figsize, dpi)
+
+def _render_batch(batch):
+    paths = []
+    for basin_id, classes, values, path in batch:
+        y_a, y_b = _chart.years
+        _chart.draw(classes, values, f"Cambio total de cobertura para la cuenca {basin_id} ({y_a}–{y_b})")
+        paths.append(_chart.save(path))
+    return paths
+
+def basin_changes(df, year_a, year_b):
+    # Igual que el notebook: cambio pct_B - pct_A sumado por (HYBAS_ID, clase)
+    df = df.assign(change_pct=df[f"pct_{year_b}"] - df[f"pct_{year_a}"])
+    return df.groupby(["HYBAS_ID", "clase_de_cobertura"], as_index=False)["change_pct"].sum()
+
+def render_charts(df, year_a, year_b, out_dir, workers=None, fmt="png", dpi=100, figsize=(12, 6), batch=25):
+    # Un gráfico por cuenca en out_dir/cuenca_<HYBAS_ID>.<fmt>, más el gráfico nacional.
+    # Devuelve {HYBAS_ID o "nacional": ruta}.
+    os.makedirs(out_dir, exist_ok=True)
+    changes = basin_changes(df, year_a, year_b)
+    classes = sorted(changes["clase_de_cobertura"].unique(), key=len, reverse=True)
+    jobs = [(bid, g["clase_de_cobertura"].tolist(), g["change_pct"].to_numpy(), os.path.join(out_dir, f"cuenca_{bid}.{fmt}"))
+            for bid, g in changes.groupby("HYBAS_ID", sort=False)]
+    batches = [jobs[i:i + batch] for i in range(0, len(jobs), batch)]
+    init = (classes, year_a, year_b, figsize, dpi)
+    workers = workers or os.cpu_count() or 1
+    if workers > 1 and len(batches) > 1:
+        with ProcessPoolExecutor(max_workers=min(workers, len(batches)), initializer=_init_worker, initargs=init) as pool:
+            paths = [p for part in pool.map(_render_batch, batches) for p in part]
+    else:
+        _init_worker(*init)
+        paths = [p for b in batches for p in _render_batch(b)]
+    out = dict(zip([j[0] for j in jobs], paths))
+    total = changes.groupby("clase_de_cobertura", as_index=False)["change_pct"].sum()
+    chart = ChangeChart(classes, year_a, year_b, figsize, dpi)
+    chart.draw(total["clase_de_cobertura"].tolist(), total["change_pct"].to_numpy(),
+               f"Cambio total de cobertura en todas las cuencas ({year_a}–{year_b})")
+    out["nacional"] = chart.save(os.path.join(out_dir, f"cambio_total_{year_a}_{year_b}.{fmt}"))
+    return out
+
+def write_report(paths, year_a, year_b, out_path):
+    # Informe HTML con el gráfico nacional y una sección por cuenca (rutas relativas al informe)
+    base = os.path.dirname(os.path.abspath(out_path))
+    parts = [f"<html><head><meta charset='utf-8'><title>Cambios de cobertura {year_a}–{year_b}</title></head><body>",
+             f"<h1>Cambios de cobertura {year_a}–{year_b}</h1>"]
+    for key, path in paths.items():
+        title = "Todas las cuencas" if key == "nacional" else f"Cuenca {key}"
+        src = html.escape(os.path.relpath(path, base).replace(os.sep, "/"))
+        parts.append(f"<h2 id='{html.escape(str(key))}'>{html.escape(title)}</h2><img src='{src}' loading='lazy' width='900'>")
+    parts.append("</body></html>")
+    with open(out_path, "w", encoding="utf-8") as f:
+        f.write("\n".join(parts))
+    return out_path
+
+def main(argv=None):
+    p = argparse.ArgumentParser(description="Gráficos de cambio de cobertura por cuenca, en lote y sin pantalla.")
+    p.add_argument("csv", help="landcover_percentage_<A>_<B>.csv")
+    p.add_argument("--years", type=int, nargs=2, required=True, metavar=("YEAR_A", "YEAR_B"))
+    p.add_argument("-o", "--output-dir", default="graficos")
+    p.add_argument("--format", default="png", choices=["png", "svg", "pdf", "jpg"])
+    p.add_argument("--dpi", type=int, default=100)
+    p.add_argument("-j", "--workers", type=int, default=None)
+    args = p.parse_args(argv)
+    df = pd.read_csv(args.csv, encoding="utf-8-sig")
+    paths = render_charts(df, *args.years, args.output_dir, args.workers, args.format, args.dpi)
+    report = write_report(paths, *args.years, os.path.join(args.output_dir, "informe.html"))
+    print(f"{len(paths) - 1} cuencas -> {args.output_dir} ({report})")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
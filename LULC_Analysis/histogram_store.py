@@ -0,0 +1,168 @@
+import argparse, hashlib, json, os, sys
+import numpy as np
+import pandas as pd
+import geopandas as gpd
+from lulc_engine import (LEGEND, NODATA, build_label_grid, cache_windows, clase, histogram, percentage_table)
+
+# Almacén incremental de histogramas por año para series largas de MapBiomas (p. ej. 2004–2023).
+# Cada fila es un conteo de píxeles (año, cuenca, clase) identificado por la huella del ráster
+# (SHA-256 del archivo) y la huella de la cuenca (id + geometría + CRS de la capa). Al actualizar
+# solo se calculan las celdas (año, cuenca) que faltan; cualquier par de años o tendencia se
+# responde desde el almacén sin volver a leer los rásteres. Cada celda calculada guarda además
+# una fila pixel_id = -1 con los píxeles sin dato de la cuenca (0 si no hay), que marca la celda
+# como hecha aunque la cuenca no tenga píxeles.
+# El almacén es una tabla larga en CSV, o en Parquet si la ruta termina en .parquet.
+COLUMNS = ["year", "raster_sha256", "basin_sha256", "HYBAS_ID", "pixel_id", "pixeles"]
+
+def file_digest(path, chunk=2**22):
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(chunk), b""):
+            h.update(block)
+    return h.hexdigest()
+
+def basin_digests(cuencas, id_col="HYBAS_ID"):
+    # Huella de cada cuenca por separado: agregar o cambiar una cuenca no invalida las demás
+    head = f"{cuencas.crs}|".encode()
+    return [hashlib.sha256(head + str(i).encode() + b"|" + wkb).hexdigest()
+            for i, wkb in zip(cuencas[id_col], cuencas.geometry.to_wkb())]
+
+class HistogramStore:
+    def __init__(self, path="histogram_store.csv"):
+        self.path = path
+        self.digests_path = os.path.join(os.path.dirname(os.path.abspath(path)), "raster_digests.json")
+        self.table = self._load()
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            return pd.DataFrame({c: pd.Series(dtype="int64" if c in ("year", "pixel_id", "pixeles") else "object")
+                                 for c in COLUMNS})
+        if self.path.endswith(".parquet"):
+            return pd.read_parquet(self.path)
+        return pd.read_csv(self.path, dtype={"raster_sha256": str, "basin_sha256": str})
+
+    def save(self):
+        # Escribe y renombra para no dejar el almacén a medias si se interrumpe una actualización
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        tmp = f"{self.path}.{os.getpid()}.tmp"
+        if self.path.endswith(".parquet"):
+            self.table.to_parquet(tmp, index=False)
+        else:
+            self.table.to_csv(tmp, index=False)
+        os.replace(tmp, self.path)
+
+    def raster_digest(self, path):
+        # SHA-256 del ráster, recordado por (ruta, tamaño, fecha) para no releer mosaicos grandes
+        st = os.stat(path)
+        tag = f"{os.path.abspath(path)}|{st.st_size}|{st.st_mtime_ns}"
+        try:
+            with open(self.digests_path) as f:
+                index = json.load(f)
+        except (OSError, ValueError):
+            index = {}
+        if tag not in index:
+            index[tag] = file_digest(path)
+            # Escribe y renombra, como el almacén, para no dejar el índice a medias
+            os.makedirs(os.path.dirname(self.digests_path), exist_ok=True)
+            tmp = f"{self.digests_path}.{os.getpid()}.tmp"
+            with open(tmp, "w") as f:
+                json.dump(index, f, indent=2)
+            os.replace(tmp, self.digests_path)
+        return index[tag]
+
+    def missing(self, cuencas, year, raster_sha, id_col="HYBAS_ID"):
+        # Posiciones de las cuencas sin histograma para (año, ráster)
+        t = self.table
+        done = set(t.loc[(t["year"] == year) & (t["raster_sha256"] == raster_sha), "basin_sha256"])
+        return [i for i, d in enumerate(basin_digests(cuencas, id_col)) if d not in done]
+
+    def update(self, cuencas, rasters, work_dir, tile=1024, workers=None, cache_dir=None, id_col="HYBAS_ID", log=print):
+        # rasters: {año: ruta}. Calcula solo las celdas que faltan y guarda después de cada año.
+        cuencas = cuencas.reset_index(drop=True)
+        digests = np.array(basin_digests(cuencas, id_col))
+        computed = {}
+        for year, path in sorted(rasters.items()):
+            raster_sha = self.raster_digest(path)
+            todo = self.missing(cuencas, year, raster_sha, id_col)
+            computed[year] = len(todo)
+            if not todo:
+                continue
+            sub = cuencas.iloc[todo].reset_index(drop=True)
+            label_path, area, windows, digest = build_label_grid(sub, path, work_dir, tile, workers, id_col)
+            source = cache_windows(path, label_path, area, windows, digest, cache_dir, workers) if cache_dir else (path, None)
+            h = histogram(label_path, area, windows, source, workers)
+            done = pd.DataFrame({"label": np.arange(1, len(sub) + 1), "pixel_id": NODATA, "pixeles": 0})
+            h = pd.concat([h, done]).groupby(["label", "pixel_id"], as_index=False)["pixeles"].sum()
+            rows = pd.DataFrame({
+                "year": year, "raster_sha256": raster_sha,
+                "basin_sha256": digests[todo][h["label"].to_numpy() - 1],
+                "HYBAS_ID": sub[id_col].to_numpy()[h["label"].to_numpy() - 1],
+                "pixel_id": h["pixel_id"].to_numpy(), "pixeles": h["pixeles"].to_numpy(),
+            })
+            self.table = pd.concat([self.table, rows], ignore_index=True)
+            self.save()
+            if log:
+                log(f"{year}: {len(todo)} cuencas calculadas, {len(cuencas) - len(todo)} desde el almacén")
+        return computed
+
+    def years(self):
+        return sorted(int(y) for y in self.table["year"].unique())
+
+    def histograms(self, cuencas, year, raster_sha=None, id_col="HYBAS_ID"):
+        # Píxeles por (label, pixel_id) de las cuencas dadas (label = posición + 1), sin NODATA.
+        # Sin raster_sha se usa el último ráster agregado para ese año.
+        t = self.table[self.table["year"] == year]
+        if raster_sha is None and len(t):
+            raster_sha = t["raster_sha256"].iloc[-1]
+        t = t[(t["raster_sha256"] == raster_sha) & (t["pixel_id"] != NODATA)]
+        label = pd.Series(np.arange(1, len(cuencas) + 1), index=basin_digests(cuencas.reset_index(drop=True), id_col))
+        label = label[~label.index.duplicated()]
+        t = t.assign(label=t["basin_sha256"].map(label)).dropna(subset=["label"])
+        return t.groupby([t["label"].astype(int), "pixel_id"])["pixeles"].sum().rename_axis(["label", "pixel_id"])
+
+    def pair(self, cuencas, year_a, year_b, legend=LEGEND, id_col="HYBAS_ID"):
+        # Misma tabla que landcover_percentage_{A}_{B}.csv, sin leer rásteres
+        cuencas = cuencas.reset_index(drop=True)
+        return percentage_table(cuencas, self.histograms(cuencas, year_a, id_col=id_col),
+                                self.histograms(cuencas, year_b, id_col=id_col), year_a, year_b, legend, id_col)
+
+    def trend(self, cuencas, years=None, legend=LEGEND, id_col="HYBAS_ID"):
+        # Porcentaje de cada clase por cuenca y año (una columna pct_{año}), ordenado por cuenca y
+        # por el porcentaje del último año
+        cuencas = cuencas.reset_index(drop=True)
+        years = sorted(years or self.years())
+        h = pd.concat([self.histograms(cuencas, y, id_col=id_col).rename(y) for y in years], axis=1).fillna(0)
+        pct = (h / h.groupby(level="label").transform("sum").replace(0, np.nan) * 100).fillna(0)
+        pct.columns = [f"pct_{y}" for y in years]
+        pct = pct.reset_index().sort_values(["label", pct.columns[-1], "pixel_id"], ascending=[True, False, True], kind="mergesort")
+        pct.insert(0, id_col, cuencas[id_col].to_numpy()[pct["label"].to_numpy() - 1])
+        pct.insert(3, "clase_de_cobertura", [clase(c, legend) for c in pct["pixel_id"]])
+        return pct.drop(columns="label").reset_index(drop=True)
+
+def main(argv=None):
+    p = argparse.ArgumentParser(description="Histogramas de cobertura por cuenca y año, calculados de forma incremental.")
+    p.add_argument("cuencas", help="Capa de cuencas (GPKG, shapefile o GeoJSON) con HYBAS_ID")
+    p.add_argument("--pattern", default="mapbiomas_data/ecuador_coverage_{year}.tif", help="Ruta de cada año con {year}")
+    p.add_argument("--years", type=int, nargs=2, default=(2004, 2023), metavar=("DESDE", "HASTA"))
+    p.add_argument("--store", default="mapbiomas_data/histogram_store.csv", help="Almacén (.csv o .parquet)")
+    p.add_argument("-o", "--output-dir", default="mapbiomas_data")
+    p.add_argument("--pair", type=int, nargs=2, metavar=("YEAR_A", "YEAR_B"), help="Escribe landcover_percentage_A_B.csv")
+    p.add_argument("--tile", type=int, default=1024, help="Tamaño de bloque en píxeles")
+    p.add_argument("-j", "--workers", type=int, default=None)
+    p.add_argument("--cache-dir", help="Guarda aquí los bloques enmascarados de cada año para reutilizarlos")
+    args = p.parse_args(argv)
+    cuencas = gpd.read_file(args.cuencas)
+    rasters = {y: args.pattern.format(year=y) for y in range(args.years[0], args.years[1] + 1)}
+    store = HistogramStore(args.store)
+    store.update(cuencas, rasters, args.output_dir, args.tile, args.workers, args.cache_dir)
+    trend_csv = os.path.join(args.output_dir, f"landcover_trend_{args.years[0]}_{args.years[1]}.csv")
+    store.trend(cuencas, list(rasters)).to_csv(trend_csv, index=False, encoding="utf-8-sig")
+    print(f"tendencia: {trend_csv}")
+    if args.pair:
+        pair_csv = os.path.join(args.output_dir, f"landcover_percentage_{args.pair[0]}_{args.pair[1]}.csv")
+        store.pair(cuencas, *args.pair).to_csv(pair_csv, index=False, encoding="utf-8-sig")
+        print(f"porcentajes: {pair_csv}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
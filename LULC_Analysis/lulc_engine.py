@@ -0,0 +1,327 @@
+import argparse, hashlib, math, os, sys
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+import geopandas as gpd
+import rasterio
+from rasterio.features import rasterize
+from rasterio.windows import Window, transform as window_transform
+from shapely.geometry import box
+
+# Motor por bloques para la tabulación cruzada de dos años de MapBiomas sobre las cuencas.
+# Reemplaza las dos llamadas a zonal_stats de LULC_analysis.ipynb (una pasada por cuenca y por
+# año) por una sola pasada por el ráster:
+#   - las cuencas se rasterizan una vez en una grilla de etiquetas (fila de la cuenca + 1, 0 fuera)
+#     alineada con el ráster y guardada como GeoTIFF teselado; se reutiliza mientras no cambien
+#     las cuencas ni la grilla del ráster;
+#   - solo se leen, directamente del mosaico nacional, los bloques que tocan alguna cuenca; la
+#     máscara de cada bloque (fuera de las cuencas o sin dato) se calcula al leerlo, sin escribir
+#     copias recortadas (masked_{year}.tif);
+#   - cada bloque lee las etiquetas y los dos años en la misma ventana y cuenta los tríos
+#     (cuenca, clase A, clase B) con un único np.bincount; de ahí salen los histogramas de cada
+#     año y la matriz de transición completa A -> B;
+#   - los bloques se reparten entre procesos y la memoria queda acotada por el tamaño de bloque;
+#   - opcionalmente, los bloques enmascarados de cada año se guardan en un GeoTIFF teselado y
+#     comprimido (cache_dir) para que las siguientes corridas con las mismas cuencas lean solo eso.
+# Igual que zonal_stats, un píxel pertenece a una cuenca si su centro cae dentro del polígono
+# (las cuencas de HydroBASINS no se solapan, así que cada píxel tiene a lo sumo una etiqueta).
+LEGEND = {
+    1: "1. Formación Forestal", 3: "1.1. Bosque", 4: "1.2. Bosque abierto", 5: "1.3. Manglar",
+    6: "1.4. Bosque inundable", 10: "2. Formación natural no forestal",
+    11: "2.1. Formación natural no forestal inundable", 12: "2.2. Herbazal",
+    29: "2.3. Afloramiento rocoso", 13: "2.4. Otra formación natural no forestal",
+    14: "3. Agropecuaria y silvicultura", 9: "3.3 Silvicultura",
+    21: "3.5 Mosaico de agricultura y/o pastos", 22: "4. Área sin vegetación",
+    23: "4.1. Playa, duna o banco de arena", 24: "4.2. Infraestructura urbana",
+    30: "4.3. Minería", 68: "4.4. Otra área natural sin vegetación",
+    25: "4.5. Otra área antrópica sin vegetación", 26: "5. Cuerpo de agua",
+    33: "5.1 Río, lago u océano", 34: "5.2 Glaciar", 31: "5.3 Acuicultura", 27: "6. No observado"
+}
+NODATA = -1  # clase interna para píxeles sin dato en uno de los años
+
+def clase(pixel_id, legend=LEGEND):
+    return legend.get(int(pixel_id), f"Desconocido {pixel_id}")
+
+def raster_grid(path):
+    with rasterio.open(path) as src:
+        return src.crs, src.transform, src.width, src.height
+
+def check_aligned(paths):
+    # Los años deben compartir CRS, transformación y tamaño para leerse con la misma ventana
+    grids = [raster_grid(p) for p in paths]
+    if any(g != grids[0] for g in grids[1:]):
+        raise ValueError("Los rásteres no comparten la misma grilla (CRS, transformación y tamaño)")
+    return grids[0]
+
+def basins_digest(cuencas, grid, id_col="HYBAS_ID", area=None):
+    # Huella de las cuencas (ids + geometrías en el CRS del ráster), de la grilla de destino y de
+    # la ventana que ocupan en ella
+    h = hashlib.sha256()
+    crs, transform, width, height = grid
+    h.update(f"{crs}|{tuple(transform)}|{width}|{height}".encode())
+    if area is not None:
+        h.update(f"|{int(area.col_off)},{int(area.row_off)},{int(area.width)},{int(area.height)}".encode())
+    h.update(np.asarray(cuencas[id_col]).astype(str).astype("U").tobytes())
+    for wkb in cuencas.geometry.to_wkb():
+        h.update(wkb)
+    return h.hexdigest()
+
+def raster_key(path):
+    # Identifica un archivo por ruta, tamaño y fecha de modificación (sin leerlo entero)
+    st = os.stat(path)
+    return hashlib.sha256(f"{os.path.abspath(path)}|{st.st_size}|{st.st_mtime_ns}".encode()).hexdigest()
+
+def pixel_extent(bounds, transform, width, height):
+    # Ventana entera que cubre bounds: origen hacia abajo y borde lejano hacia arriba (round_lengths
+    # trunca el ancho y el alto y dejaba fuera la última columna y fila), recortada al ráster
+    w = rasterio.windows.from_bounds(*bounds, transform=transform)
+    col0, row0 = math.floor(w.col_off), math.floor(w.row_off)
+    col1, row1 = math.ceil(w.col_off + w.width), math.ceil(w.row_off + w.height)
+    return Window(col0, row0, col1 - col0, row1 - row0).intersection(Window(0, 0, width, height))
+
+def tile_windows(area, tile):
+    # Ventanas de tile x tile píxeles que cubren area (ventana del ráster)
+    row0, col0 = int(area.row_off), int(area.col_off)
+    row1, col1 = row0 + int(area.height), col0 + int(area.width)
+    for row in range(row0, row1, tile):
+        for col in range(col0, col1, tile):
+            yield Window(col, row, min(tile, col1 - col), min(tile, row1 - row))
+
+def basin_windows(g, area, transform, tile):
+    # Ventanas de tile x tile dentro de area que tocan alguna cuenca, con las cuencas que tocan
+    for w in tile_windows(area, tile):
+        hit = g.sindex.query(box(*rasterio.windows.bounds(w, transform)), predicate="intersects")
+        if len(hit):
+            yield w, hit
+
+def shift(window, area):
+    # Ventana del ráster expresada en un archivo cuyo origen es la esquina de area
+    return Window(window.col_off - area.col_off, window.row_off - area.row_off, window.width, window.height)
+
+def _rasterize_tile(job):
+    shapes, window, transform = job
+    return rasterize(shapes, out_shape=(int(window.height), int(window.width)),
+                     transform=transform, fill=0, dtype="uint32")
+
+def build_label_grid(cuencas, raster_path, out_dir, tile=1024, workers=None, id_col="HYBAS_ID"):
+    # Rasteriza las cuencas una sola vez. Devuelve (ruta de la grilla, ventana que ocupa en el
+    # ráster, ventanas del ráster que tocan alguna cuenca, huella de las cuencas)
+    grid = raster_grid(raster_path)
+    crs, transform, width, height = grid
+    g = cuencas.geometry.to_crs(crs)
+    area = pixel_extent(g.total_bounds, transform, width, height)
+    digest = basins_digest(cuencas.set_geometry(g), grid, id_col, area)
+    path = os.path.join(out_dir, f"labels_{digest[:16]}.tif")
+    tiles = list(basin_windows(g, area, transform, tile))
+    windows = [w for w, _ in tiles]
+    if os.path.exists(path):
+        return path, area, windows, digest
+    os.makedirs(out_dir, exist_ok=True)
+    labels = np.arange(1, len(g) + 1)
+    dtype = "uint16" if len(g) < 2**16 else "uint32"
+    jobs = [(list(zip(g.values[hit], labels[hit])), w, window_transform(w, transform)) for w, hit in tiles]
+    profile = dict(driver="GTiff", width=int(area.width), height=int(area.height), count=1, dtype=dtype,
+                   crs=crs, transform=window_transform(area, transform), nodata=0,
+                   tiled=True, blockxsize=256, blockysize=256, compress="deflate")
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with rasterio.open(tmp, "w", **profile) as dst:
+        dst.update_tags(basins_sha256=digest, col_off=int(area.col_off), row_off=int(area.row_off))
+        # Los bloques sin cuencas no se escriben: quedan vacíos en el GeoTIFF y se leen como 0
+        for (_, w, _), block in zip(jobs, _map(_rasterize_tile, jobs, workers)):
+            dst.write(block.astype(dtype), 1, window=shift(w, area))
+    os.replace(tmp, path)
+    return path, area, windows, digest
+
+def _map(fn, jobs, workers):
+    workers = workers or os.cpu_count() or 1
+    if workers > 1 and len(jobs) > 1:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            yield from pool.map(fn, jobs)
+    else:
+        yield from map(fn, jobs)
+
+def read_masked(src, window, labels):
+    # Máscara virtual: el bloque del ráster enmascarado fuera de las cuencas y donde no hay dato,
+    # equivalente a leer la misma ventana de masked_{year}.tif
+    band = src.read(1, window=window, masked=True)
+    return np.ma.masked_array(band.data, np.ma.getmaskarray(band) | (labels == 0))
+
+def _read_classes(src, window, inside):
+    # Valores enteros de los píxeles dentro de las cuencas, con NODATA donde el ráster no tiene dato
+    band = src.read(1, window=window, masked=True)
+    return np.where(np.ma.getmaskarray(band), NODATA, band.data.astype(np.int64))[inside]
+
+def _read_labels(label_path, window):
+    with rasterio.open(label_path) as src:
+        return src.read(1, window=window)
+
+def _tile_crosstab(job):
+    label_path, label_window, (path_a, window_a), (path_b, window_b) = job
+    lab = _read_labels(label_path, label_window)
+    inside = lab > 0
+    if not inside.any():
+        return None
+    with rasterio.open(path_a) as src_a, rasterio.open(path_b) as src_b:
+        a = _read_classes(src_a, window_a, inside)
+        b = _read_classes(src_b, window_b, inside)
+    lab = lab[inside]
+    # Compacta cuencas y clases presentes en el bloque para que el bincount sea pequeño
+    ids, li = np.unique(lab, return_inverse=True)
+    vals, ci = np.unique(np.concatenate([a, b]), return_inverse=True)
+    k = len(vals)
+    code = (li * k + ci[:len(a)]) * k + ci[len(a):]
+    counts = np.bincount(code, minlength=len(ids) * k * k)
+    nz = np.nonzero(counts)[0]
+    return ids[nz // (k * k)], vals[nz // k % k], vals[nz % k], counts[nz]
+
+def _tile_histogram(job):
+    label_path, label_window, (path, window) = job
+    lab = _read_labels(label_path, label_window)
+    inside = lab > 0
+    if not inside.any():
+        return None
+    with rasterio.open(path) as src:
+        v = _read_classes(src, window, inside)
+    ids, li = np.unique(lab[inside], return_inverse=True)
+    vals, ci = np.unique(v, return_inverse=True)
+    counts = np.bincount(li * len(vals) + ci, minlength=len(ids) * len(vals))
+    nz = np.nonzero(counts)[0]
+    return ids[nz // len(vals)], vals[nz % len(vals)], counts[nz]
+
+def _tile_masked(job):
+    label_path, label_window, raster_path, window = job
+    lab = _read_labels(label_path, label_window)
+    with rasterio.open(raster_path) as src:
+        return read_masked(src, window, lab)
+
+def cache_windows(raster_path, label_path, area, windows, digest, cache_dir, workers=None):
+    # Copia teselada y comprimida de los bloques enmascarados de un año, limitada a la zona de
+    # las cuencas. La validez de cada píxel va en la banda de máscara interna del GeoTIFF.
+    # Devuelve (ruta, origen) para leerla con las mismas ventanas que el ráster original.
+    path = os.path.join(cache_dir, f"windows_{raster_key(raster_path)[:16]}_{digest[:16]}.tif")
+    if os.path.exists(path):
+        return path, area
+    os.makedirs(cache_dir, exist_ok=True)
+    with rasterio.open(raster_path) as src:
+        profile = dict(driver="GTiff", width=int(area.width), height=int(area.height), count=1, dtype=src.dtypes[0],
+                       crs=src.crs, transform=window_transform(area, src.transform),
+                       tiled=True, blockxsize=256, blockysize=256, compress="deflate", predictor=2)
+    jobs = [(label_path, shift(w, area), raster_path, w) for w in windows]
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with rasterio.Env(GDAL_TIFF_INTERNAL_MASK=True), rasterio.open(tmp, "w", **profile) as dst:
+        for w, block in zip(windows, _map(_tile_masked, jobs, workers)):
+            dst.write(block.filled(0), 1, window=shift(w, area))
+            dst.write_mask(~np.ma.getmaskarray(block), window=shift(w, area))
+    os.replace(tmp, path)
+    return path, area
+
+def _locate(source, w):
+    # Cada fuente es (ruta, origen): origen None para el ráster original, o area para una copia
+    # en caché cuya esquina coincide con la de area
+    path, origin = source
+    return path, (w if origin is None else shift(w, origin))
+
+def _collect(parts, columns):
+    parts = [p for p in parts if p is not None]
+    if not parts:
+        return pd.DataFrame({k: [] for k in columns}, dtype=np.int64)
+    df = pd.DataFrame({k: np.concatenate([p[i] for p in parts]) for i, k in enumerate(columns)})
+    return df.groupby(columns[:-1], as_index=False, sort=True)[columns[-1]].sum()
+
+def crosstab(label_path, area, windows, source_a, source_b, workers=None):
+    # Conteo de píxeles por (etiqueta, clase A, clase B) en una pasada por los bloques con cuencas
+    jobs = [(label_path, shift(w, area), _locate(source_a, w), _locate(source_b, w)) for w in windows]
+    return _collect(_map(_tile_crosstab, jobs, workers), ["label", "a", "b", "pixeles"])
+
+def histogram(label_path, area, windows, source, workers=None):
+    # Conteo de píxeles por (etiqueta, clase) de un solo año; pixel_id NODATA cuenta los píxeles
+    # de la cuenca sin dato
+    jobs = [(label_path, shift(w, area), _locate(source, w)) for w in windows]
+    return _collect(_map(_tile_histogram, jobs, workers), ["label", "pixel_id", "pixeles"])
+
+def histograms(counts, column):
+    # Histograma por (etiqueta, clase) de un año a partir de la tabla cruzada
+    valid = counts[counts[column] != NODATA]
+    return valid.groupby(["label", column])["pixeles"].sum().rename_axis(["label", "pixel_id"])
+
+def percentage_table(cuencas, hist_a, hist_b, year_a, year_b, legend=LEGEND, id_col="HYBAS_ID"):
+    # Mismas filas que el bucle del notebook: clases presentes en cualquiera de los dos años,
+    # porcentaje sobre los píxeles con dato de cada año y orden por pct del año final (descendente).
+    # Los empates se ordenan por pixel_id, en lugar del orden arbitrario de un set de Python.
+    # hist_a / hist_b: píxeles por (label, pixel_id), sin NODATA (ver histograms).
+    col_a, col_b = f"pct_{year_a}", f"pct_{year_b}"
+    h = pd.concat([hist_a.rename("A"), hist_b.rename("B")], axis=1).fillna(0).reset_index()
+    if h.empty:
+        return pd.DataFrame(columns=[id_col, "pixel_id", "clase_de_cobertura", col_a, col_b])
+    total = h.groupby("label")[["A", "B"]].transform("sum")
+    h[col_a] = np.where(total["A"] > 0, (h["A"] / total["A"].where(total["A"] > 0, 1)) * 100, 0)
+    h[col_b] = np.where(total["B"] > 0, (h["B"] / total["B"].where(total["B"] > 0, 1)) * 100, 0)
+    h = h.sort_values(["label", col_b, "pixel_id"], ascending=[True, False, True], kind="mergesort")
+    return pd.DataFrame({
+        id_col: cuencas[id_col].to_numpy()[h["label"].to_numpy() - 1],
+        "pixel_id": h["pixel_id"].astype(int).to_numpy(),
+        "clase_de_cobertura": [clase(c, legend) for c in h["pixel_id"]],
+        col_a: h[col_a].to_numpy(),
+        col_b: h[col_b].to_numpy(),
+    })
+
+def transition_tables(cuencas, counts, year_a, year_b, legend=LEGEND, id_col="HYBAS_ID"):
+    # Transiciones por cuenca (formato largo) y matriz nacional A -> B en píxeles
+    t = counts[(counts["a"] != NODATA) & (counts["b"] != NODATA)]
+    t = t.assign(total=t.groupby("label")["pixeles"].transform("sum"))
+    t = t.sort_values(["label", "pixeles", "a", "b"], ascending=[True, False, True, True], kind="mergesort")
+    largo = pd.DataFrame({
+        id_col: cuencas[id_col].to_numpy()[t["label"].to_numpy() - 1],
+        f"pixel_id_{year_a}": t["a"].to_numpy(),
+        f"clase_{year_a}": [clase(c, legend) for c in t["a"]],
+        f"pixel_id_{year_b}": t["b"].to_numpy(),
+        f"clase_{year_b}": [clase(c, legend) for c in t["b"]],
+        "pixeles": t["pixeles"].to_numpy(),
+        "pct_cuenca": (t["pixeles"] / t["total"] * 100).to_numpy(),
+    })
+    matriz = t.pivot_table(index="a", columns="b", values="pixeles", aggfunc="sum", fill_value=0)
+    matriz.index = [clase(c, legend) for c in matriz.index]
+    matriz.columns = [clase(c, legend) for c in matriz.columns]
+    matriz.index.name = f"{year_a} \\ {year_b}"
+    return largo, matriz
+
+def analyze(cuencas, path_a, path_b, year_a, year_b, out_dir, tile=1024, workers=None, legend=LEGEND,
+            id_col="HYBAS_ID", cache_dir=None):
+    # Una pasada: grilla de etiquetas, tabla cruzada y los tres CSV. Devuelve las rutas escritas.
+    # Con cache_dir, los bloques enmascarados de cada año se guardan (o se reutilizan) ahí.
+    cuencas = cuencas.reset_index(drop=True)
+    check_aligned([path_a, path_b])
+    label_path, area, windows, digest = build_label_grid(cuencas, path_a, out_dir, tile, workers, id_col)
+    sources = [(path_a, None), (path_b, None)]
+    if cache_dir is not None:
+        sources = [cache_windows(p, label_path, area, windows, digest, cache_dir, workers) for p in (path_a, path_b)]
+    counts = crosstab(label_path, area, windows, *sources, workers)
+    pct = percentage_table(cuencas, histograms(counts, "a"), histograms(counts, "b"), year_a, year_b, legend, id_col)
+    largo, matriz = transition_tables(cuencas, counts, year_a, year_b, legend, id_col)
+    paths = {"porcentajes": os.path.join(out_dir, f"landcover_percentage_{year_a}_{year_b}.csv"),
+             "transiciones": os.path.join(out_dir, f"landcover_transitions_{year_a}_{year_b}.csv"),
+             "matriz": os.path.join(out_dir, f"landcover_transition_matrix_{year_a}_{year_b}.csv")}
+    pct.to_csv(paths["porcentajes"], index=False, encoding="utf-8-sig")
+    largo.to_csv(paths["transiciones"], index=False, encoding="utf-8-sig")
+    matriz.to_csv(paths["matriz"], encoding="utf-8-sig")
+    return paths
+
+def main(argv=None):
+    p = argparse.ArgumentParser(description="Porcentajes de cobertura y transiciones entre dos años por cuenca.")
+    p.add_argument("cuencas", help="Capa de cuencas (GPKG, shapefile o GeoJSON) con HYBAS_ID")
+    p.add_argument("raster_a", help="Mapa de cobertura del año inicial (GeoTIFF)")
+    p.add_argument("raster_b", help="Mapa de cobertura del año final, en la misma grilla")
+    p.add_argument("--years", type=int, nargs=2, required=True, metavar=("YEAR_A", "YEAR_B"))
+    p.add_argument("-o", "--output-dir", default=".")
+    p.add_argument("--tile", type=int, default=1024, help="Tamaño de bloque en píxeles")
+    p.add_argument("-j", "--workers", type=int, default=None)
+    p.add_argument("--cache-dir", help="Guarda aquí los bloques enmascarados de cada año para reutilizarlos")
+    args = p.parse_args(argv)
+    paths = analyze(gpd.read_file(args.cuencas), args.raster_a, args.raster_b, *args.years,
+                    args.output_dir, args.tile, args.workers, cache_dir=args.cache_dir)
+    for name, path in paths.items():
+        print(f"{name}: {path}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
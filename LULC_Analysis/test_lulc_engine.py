@@ -0,0 +1,51 @@
+import numpy as np
+import pandas as pd
+import geopandas as gpd
+import pytest
+import rasterio
+from rasterio.features import rasterize
+from rasterio.transform import from_origin
+from shapely.geometry import box
+from lulc_engine import build_label_grid, cache_windows, histogram, pixel_extent
+
+WIDTH, HEIGHT = 200, 150
+TRANSFORM = from_origin(0, HEIGHT, 1, 1)
+
+@pytest.fixture
+def raster(tmp_path):
+    path = tmp_path / "cobertura.tif"
+    data = np.random.default_rng(0).integers(1, 6, (HEIGHT, WIDTH), dtype=np.uint8)
+    with rasterio.open(path, "w", driver="GTiff", width=WIDTH, height=HEIGHT, count=1, dtype="uint8",
+                       crs="EPSG:32717", transform=TRANSFORM) as dst:
+        dst.write(data, 1)
+    return path, data
+
+@pytest.fixture
+def cuencas():
+    # La segunda cuenca llega al borde este y al borde sur de la capa, con origen fraccionario
+    return gpd.GeoDataFrame({"HYBAS_ID": [101, 633]},
+                            geometry=[box(10.2, 90.5, 60.7, 140.3), box(63.64, 0, WIDTH, 55.3)], crs="EPSG:32717")
+
+def reference(cuencas, data):
+    # Rasterizar cada cuenca sobre todo el ráster y contar sus píxeles por clase
+    rows = []
+    for label, geom in enumerate(cuencas.geometry, 1):
+        inside = rasterize([(geom, 1)], out_shape=data.shape, transform=TRANSFORM, fill=0, dtype="uint8").astype(bool)
+        ids, counts = np.unique(data[inside], return_counts=True)
+        rows += [(label, int(i), int(c)) for i, c in zip(ids, counts)]
+    return pd.DataFrame(rows, columns=["label", "pixel_id", "pixeles"])
+
+def test_pixel_extent_keeps_far_edge():
+    area = pixel_extent((63.64, 0, WIDTH, 55.3), TRANSFORM, WIDTH, HEIGHT)
+    assert (area.col_off, area.row_off) == (63, 94)
+    assert (area.col_off + area.width, area.row_off + area.height) == (WIDTH, HEIGHT)
+
+@pytest.mark.parametrize("cached", [False, True])
+def test_histogram_matches_reference_on_layer_edge(tmp_path, raster, cuencas, cached):
+    path, data = raster
+    label_path, area, windows, digest = build_label_grid(cuencas, path, tmp_path / "labels", tile=64, workers=1)
+    source = cache_windows(path, label_path, area, windows, digest, tmp_path / "cache", workers=1) if cached else (path, None)
+    h = histogram(label_path, area, windows, source, workers=1)
+    h = h[h["pixel_id"] >= 0].sort_values(["label", "pixel_id"]).reset_index(drop=True)
+    expected = reference(cuencas, data)
+    pd.testing.assert_frame_equal(h.astype("int64"), expected.astype("int64"))
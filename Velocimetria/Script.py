@@ -1,14 +1,19 @@
-import cv2, os, sys, threading, shutil
+import cv2, os, sys, threading, queue
 import tkinter as tk
 from tkinter import ttk, filedialog, simpledialog, Frame, Button, Label
 import numpy as np
-import matplotlib
 import matplotlib.pyplot as plt
 import matplotlib.image as mpimg
 from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
 import pandas as pd
-import scipy.interpolate as interp
-import opyf  
+from pipeline import run_optical_flow, run_time_series, VEC_TIME
+from cache import ResultCache
+from frames import FrameProvider
+from sampling import update_sampler
+from fieldstore import is_field, open_field
+from render import ImageView, FieldView, TransectOverlay, ProfileView
+from preview import SparseFlowPreview, draw_vectors
+from discharge import ALPHA, estimate, read_depth
 
 class SharedData:
     def __init__(self):
@@ -16,10 +21,11 @@ class SharedData:
         self.saved_frame_path = None
         self.calibration_factor = None
         self.calibration_points = None
-        self.optical_flow_csv = None
+        self.optical_flow_field = None
         self.optical_flow_output_dir = None
 
 class VideoFrameTab(Frame):
+    FRAME_CACHE_MB = 512
     def __init__(self, master, shared):
         super().__init__(master)
         self.shared = shared
@@ -31,7 +37,14 @@ class VideoFrameTab(Frame):
         self.label.pack(pady=5)
         self.btn_save = Button(self, text="Save Frame", command=self.save_frame)
         self.btn_save.pack(pady=5)
-        self.cap = None
+        self.live_flow = tk.BooleanVar(value=False)
+        tk.Checkbutton(self, text="Live flow preview (sparse Lucas-Kanade)", variable=self.live_flow,
+                       command=lambda: self.update_frame(self.current_frame_idx)).pack(pady=2)
+        Button(self, text="Set Preview ROI", command=self.select_roi).pack(pady=2)
+        self.flow_label = Label(self, text="")
+        self.flow_label.pack(pady=2)
+        self.preview = SparseFlowPreview()
+        self.frames = None
         self.total_frames = 0
         self.fps = 0
         self.current_frame = None
@@ -42,38 +55,81 @@ class VideoFrameTab(Frame):
         self.shared.video_path = filedialog.askopenfilename(filetypes=[("Video files", "*.mp4;*.avi;*.mov;*.mkv")])
         if not self.shared.video_path: 
             return
-        self.cap = cv2.VideoCapture(self.shared.video_path)
-        if not self.cap.isOpened(): 
+        if self.frames:
+            self.frames.close()
+            self.frames = None
+        try:
+            self.frames = FrameProvider(self.shared.video_path, display_size=(800,600), max_bytes=self.FRAME_CACHE_MB*2**20)
+        except IOError:
             return
-        self.total_frames = int(self.cap.get(cv2.CAP_PROP_FRAME_COUNT))
-        self.fps = self.cap.get(cv2.CAP_PROP_FPS)
+        self.total_frames = self.frames.total_frames
+        self.fps = self.frames.fps
+        self.preview.set_roi(None)
         self.slider.config(to=self.total_frames-1)
         self.update_frame(0)
 
     def update_frame(self, val):
         frame_idx = int(float(val))
-        if self.cap:
-            self.cap.set(cv2.CAP_PROP_POS_FRAMES, frame_idx)
-            ret, frame = self.cap.read()
-            if ret:
+        if self.frames:
+            frame = self.frames.get(frame_idx)
+            if frame is not None:
                 self.current_frame = frame
                 self.current_frame_idx = frame_idx
                 timestamp = frame_idx/self.fps if self.fps else 0
                 self.label.config(text=f"Frame: {frame_idx} | Time: {timestamp:.2f}s")
-                frame_disp = cv2.resize(cv2.cvtColor(frame, cv2.COLOR_BGR2RGB), (800,600))
+                if self.live_flow.get():
+                    frame = self.flow_overlay(frame_idx, frame)
+                else:
+                    self.flow_label.config(text="")
+                frame_disp = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
                 cv2.imshow("Frame Viewer", frame_disp)
 
+    def flow_overlay(self, frame_idx, frame):
+        # Pairs the frame with the one opyf would use (VEC_TIME step) and reports the displacement
+        # in full-resolution px/frame, the unit of the vlim entry, plus m/s once calibrated
+        gap = VEC_TIME["step"]
+        partner_idx = frame_idx + gap if frame_idx + gap < self.total_frames else frame_idx - gap
+        if partner_idx < 0:
+            return frame
+        partner = self.frames.get(partner_idx, schedule=False)
+        if partner is None:
+            return frame
+        pts, disp = self.preview.compute(frame_idx, frame, partner_idx, partner)
+        disp = disp * np.sign(partner_idx - frame_idx) / gap
+        # The preview is resized to display_size without keeping the aspect ratio: scale x and y apart
+        w, h = self.frames.frame_size
+        px = np.hypot(disp[:, 0] * w / frame.shape[1], disp[:, 1] * h / frame.shape[0])
+        if len(px):
+            p50, p95 = np.percentile(px, [50, 95])
+            text = f"{len(px)} vectors | median {p50:.2f} px/frame | p95 {p95:.2f} px/frame"
+            if self.shared.calibration_factor and self.fps:
+                text += f" | p95 {p95 * self.shared.calibration_factor * self.fps:.2f} m/s"
+        else:
+            text = "No trackable features in the preview region"
+        self.flow_label.config(text=text)
+        return draw_vectors(frame, pts, disp, gain=4.0 * gap, roi=self.preview.roi)
+
+    def select_roi(self):
+        if self.current_frame is None:
+            return
+        roi = cv2.selectROI("Frame Viewer", self.current_frame, showCrosshair=False)
+        self.preview.set_roi(roi)
+        self.update_frame(self.current_frame_idx)
+
     def save_frame(self):
         if self.current_frame is not None and self.shared.video_path:
+            frame = self.frames.read_full(self.current_frame_idx)
+            if frame is None:
+                return
             directory = os.path.dirname(self.shared.video_path)
             fname = os.path.join(directory, f"frame_{self.current_frame_idx}.png")
-            cv2.imwrite(fname, self.current_frame)
+            cv2.imwrite(fname, frame)
             self.shared.saved_frame_path = fname
             print(f"Frame saved as {fname}")
 
     def __del__(self):
-        if self.cap: 
-            self.cap.release()
+        if self.frames: 
+            self.frames.close()
         cv2.destroyAllWindows()
 
 class CalibrationTab(Frame):
@@ -144,12 +200,35 @@ class OpticalFlowTab(Frame):
         self.vlim_entry = tk.Entry(self.frm, width=8)
         self.vlim_entry.grid(row=1, column=1, padx=5, pady=2)
         self.vlim_entry.insert(0, "10")
+        self.time_series = tk.BooleanVar(value=False)
+        tk.Checkbutton(self.frm, text="Time series over the whole video (parallel windows)", variable=self.time_series).grid(row=2, column=0, columnspan=2, pady=2)
+        Label(self.frm, text="End Frame (blank = last):").grid(row=3, column=0, padx=5, pady=2)
+        self.end_entry = tk.Entry(self.frm, width=8)
+        self.end_entry.grid(row=3, column=1, padx=5, pady=2)
+        self.use_cache = tk.BooleanVar(value=True)
+        tk.Checkbutton(self.frm, text="Reuse cached results for identical video and parameters", variable=self.use_cache).grid(row=4, column=0, columnspan=2, pady=2)
+        self.cache = ResultCache()
         self.btn_run = Button(self, text="Run Optical Flow Analysis", command=self.run_optical_flow)
         self.btn_run.pack(pady=5)
         self.btn_select_output = Button(self, text="Select Optical Flow Output Directory", command=self.select_output_dir)
         self.btn_select_output.pack(pady=5)
+        Button(self, text="Clear Optical Flow Cache", command=self.clear_cache).pack(pady=5)
         self.status = Label(self, text="Waiting for input.")
         self.status.pack(pady=5)
+        self.progress = queue.Queue()
+        self.worker_thread = None
+
+    def poll_progress(self):
+        # Tk widgets may only be touched from the main thread; the worker posts messages here
+        try:
+            while True:
+                self.status.config(text=self.progress.get_nowait())
+        except queue.Empty:
+            pass
+        if self.worker_thread is not None and self.worker_thread.is_alive():
+            self.after(100, self.poll_progress)
+        elif not self.progress.empty():
+            self.after(0, self.poll_progress)
 
     def select_output_dir(self):
         directory = filedialog.askdirectory(title="Select Optical Flow Output Directory")
@@ -159,6 +238,10 @@ class OpticalFlowTab(Frame):
         else:
             self.status.config(text="Using default output directory.")
 
+    def clear_cache(self):
+        removed = self.cache.invalidate()
+        self.status.config(text=f"Removed {len(removed)} cached optical flow results.")
+
     def run_optical_flow(self):
         if not self.shared.video_path:
             self.status.config(text="Select a video in Step 1.")
@@ -169,52 +252,30 @@ class OpticalFlowTab(Frame):
         try:
             start_frame = int(self.start_entry.get())
             vlim = float(self.vlim_entry.get())
+            end_frame = int(self.end_entry.get()) if self.end_entry.get().strip() else None
         except Exception as e:
             self.status.config(text="Invalid parameters.")
             return
         self.status.config(text="Processing optical flow...")
+        time_series = self.time_series.get()
+        post = self.progress.put
+        cache = self.cache if self.use_cache.get() else None
         def worker():
-            import matplotlib.pyplot as plt
-            matplotlib.use('Agg')
-            print("Worker started. Using backend:", matplotlib.get_backend())
             try:
-                video = opyf.videoAnalyzer(self.shared.video_path)
-                print("videoAnalyzer created")
-                video.set_vecTime(Ntot=8, shift=1, step=2, starting_frame=start_frame)
-                print("set_vecTime done")
-                video.extractGoodFeaturesAndDisplacements(display=None, displayColor=False, width=0.002)
-                print("extractGoodFeaturesAndDisplacements done")
-                plt.close('all')
-                video.set_vlim([0, vlim])
-                print("set_vlim done")
-                video.extractGoodFeaturesAndDisplacements(display=None, displayColor=False, width=0.002)
-                print("second extractGoodFeaturesAndDisplacements done")
-                plt.close('all')
-                video.set_filtersParams(wayBackGoodFlag=4, RadiusF=20, maxDevInRadius=1, CLAHE=True)
-                print("set_filtersParams done")
-                video.set_goodFeaturesToTrackParams(maxCorners=40000, qualityLevel=0.005)
-                print("set_goodFeaturesToTrackParams done")
-                video.set_opticalFlowParams(maxLevel=3)
-                print("set_opticalFlowParams done")
-                video.extractGoodFeaturesPositionsDisplacementsAndInterpolate(display=None, displayColor=False, scale=10, width=0.005)
-                print("extractGoodFeaturesPositionsDisplacementsAndInterpolate done")
-                plt.close('all')
-                video.scaleData(framesPerSecond=30, metersPerPx=self.shared.calibration_factor, unit=['m','s'], origin=[0, video.Hvis])
-                print("scaleData done")
-                video.writeVelocityField(fileFormat='csv')
-                print("writeVelocityField done")
-                plt.close('all')
                 output_dir = self.shared.optical_flow_output_dir if self.shared.optical_flow_output_dir else os.getcwd()
-                filename = os.path.join(output_dir, "velocity_field.csv")
-                if os.path.exists(os.path.join(os.getcwd(), "velocity_field.csv")):
-                    shutil.move(os.path.join(os.getcwd(), "velocity_field.csv"), filename)
-                self.shared.optical_flow_csv = filename
-                self.status.config(text="Optical flow analysis complete. CSV saved.")
-                print("Optical flow worker finished.")
-            except Exception as e:
+                if time_series:
+                    filename = run_time_series(self.shared.video_path, self.shared.calibration_factor, vlim, output_dir,
+                                               start_frame=start_frame, end_frame=end_frame, log=post, cache=cache)
+                else:
+                    filename = run_optical_flow(self.shared.video_path, self.shared.calibration_factor, start_frame, vlim, output_dir, log=post, cache=cache)
+                self.shared.optical_flow_field = filename
+                post(f"Optical flow analysis complete. Field saved to {filename} (timings in trace.json)")
+            except (Exception, SystemExit) as e:
                 print("Error in optical flow worker:", e)
-                self.status.config(text=f"Error: {e}")
-        threading.Thread(target=worker).start()
+                post(f"Error: {e}")
+        self.worker_thread = threading.Thread(target=worker, daemon=True)
+        self.worker_thread.start()
+        self.poll_progress()
 
 class VelocityAnalysisTab(Frame):
     def __init__(self, master, shared):
@@ -223,15 +284,17 @@ class VelocityAnalysisTab(Frame):
         Label(self, text="Velocity Field Analyzer").pack(pady=5)
         ctrl = Frame(self)
         ctrl.pack(pady=5)
-        Button(ctrl, text="1. Select CSV File", command=self.select_csv).grid(row=0, column=0, padx=5)
+        Button(ctrl, text="1. Select Velocity Field", command=self.select_field).grid(row=0, column=0, padx=5)
         Button(ctrl, text="2. Select Image", command=self.select_image).grid(row=0, column=1, padx=5)
         Button(ctrl, text="3. Apply Rescaling", command=self.apply_rescaling).grid(row=0, column=2, padx=5)
         Button(ctrl, text="4. Select Save Directory", command=self.select_save_dir).grid(row=0, column=3, padx=5)
         self.analyze_btn = Button(ctrl, text="5. Analyze Data", command=self.calculate_velocity_profile, state=tk.DISABLED)
         self.analyze_btn.grid(row=0, column=4, padx=5)
-        Button(ctrl, text="Clear Selection", command=self.clear_selection).grid(row=0, column=5, padx=5)
-        Button(ctrl, text="Reload Points", command=self.reload_points).grid(row=0, column=6, padx=5)
-        self.status = Label(self, text="Step 1: Select CSV file", anchor='w')
+        self.discharge_btn = Button(ctrl, text="6. Discharge", command=self.compute_discharge, state=tk.DISABLED)
+        self.discharge_btn.grid(row=0, column=5, padx=5)
+        Button(ctrl, text="Clear Selection", command=self.clear_selection).grid(row=0, column=6, padx=5)
+        Button(ctrl, text="Reload Points", command=self.reload_points).grid(row=0, column=7, padx=5)
+        self.status = Label(self, text="Step 1: Select velocity field (field.json or CSV)", anchor='w')
         self.status.pack(fill='x', padx=5, pady=5)
         top = Frame(self)
         top.pack(fill='both', expand=True, padx=5, pady=5)
@@ -249,48 +312,54 @@ class VelocityAnalysisTab(Frame):
         self.ax_profile = self.fig_profile.add_subplot(111)
         self.canvas_profile = FigureCanvasTkAgg(self.fig_profile, master=bot)
         self.canvas_profile.get_tk_widget().pack(fill='both', expand=True)
+        self.frame_view = ImageView(self.ax_frame)
+        self.field_view = FieldView(self.fig_velocity, self.ax_velocity)
+        self.ax_velocity.set_title("Velocity Field (m/s)")
+        self.ax_velocity.set_xlabel("X (m)")
+        self.ax_velocity.set_ylabel("Y (m)")
+        self.profile_view = ProfileView(self.ax_profile)
+        self.frame_marks = TransectOverlay(self.ax_frame, self.canvas_frame)
+        self.velocity_marks = TransectOverlay(self.ax_velocity, self.canvas_velocity)
+        self.click_cids = None
         self.save_dir = os.getcwd()
-        self.csv_file = None; self.image_file = None
+        self.field_file = None; self.image_file = None
         self.X = None; self.Y = None; self.Ux = None; self.Uy = None; self.vel = None; self.img = None; self.extent = None
+        self.sampler = None
         self.selected_points = []
 
-    def select_csv(self):
-        self.csv_file = filedialog.askopenfilename(title="Select CSV with velocity data",
-                                                   filetypes=[("CSV Files","*.csv")])
-        if self.csv_file:
-            self.status.config(text=f"CSV selected: {os.path.basename(self.csv_file)}")
+    def select_field(self):
+        self.field_file = filedialog.askopenfilename(title="Select velocity field (field.json) or CSV",
+                                                     filetypes=[("Velocity fields","*.json;*.csv"),("CSV Files","*.csv")])
+        if self.field_file:
+            self.status.config(text=f"Field selected: {os.path.basename(self.field_file)}")
             self.load_velocity_data()
 
     def load_velocity_data(self):
         try:
-            df = pd.read_csv(self.csv_file)
-            self.X = df["X"].values
-            self.Y = df["Y"].values
-            for key in ["Ux_[m.s^{-1}]", "Ux_[m.s-1]", "Ux"]:
-                if key in df.columns:
-                    self.Ux = df[key].values; break
-            for key in ["Uy_[m.s^{-1}]", "Uy_[m.s-1]", "Uy"]:
-                if key in df.columns:
-                    self.Uy = df[key].values; break
+            if is_field(self.field_file):
+                self.X, self.Y, self.Ux, self.Uy = open_field(self.field_file).points()
+            else:
+                df = pd.read_csv(self.field_file)
+                self.X = df["X"].values
+                self.Y = df["Y"].values
+                for key in ["Ux_[m.s^{-1}]", "Ux_[m.s-1]", "Ux"]:
+                    if key in df.columns:
+                        self.Ux = df[key].values; break
+                for key in ["Uy_[m.s^{-1}]", "Uy_[m.s-1]", "Uy"]:
+                    if key in df.columns:
+                        self.Uy = df[key].values; break
             self.vel = np.sqrt(self.Ux**2+self.Uy**2)
+            self.sampler = update_sampler(self.sampler, self.X, self.Y, self.vel)
             self.display_velocity_field()
             self.status.config(text="Velocity data loaded. Now select an image (Step 2).")
         except Exception as e:
-            self.status.config(text=f"Error loading CSV: {e}")
+            self.status.config(text=f"Error loading velocity field: {e}")
 
     def display_velocity_field(self):
         if self.vel is None:
             return
-        self.ax_velocity.clear()
-        sc = self.ax_velocity.scatter(self.X, self.Y, c=self.vel, cmap="plasma", alpha=0.8, s=15)
-        self.fig_velocity.colorbar(sc, ax=self.ax_velocity, label="Velocity (m/s)")
-        self.ax_velocity.set_title("Velocity Field (m/s)")
-        self.ax_velocity.set_xlabel("X (m)")
-        self.ax_velocity.set_ylabel("Y (m)")
         # If the rescaled extent is available, use it:
-        if self.extent is not None:
-            self.ax_velocity.set_xlim(self.extent[0], self.extent[1])
-            self.ax_velocity.set_ylim(self.extent[2], self.extent[3])
+        self.field_view.set_field(self.X, self.Y, self.vel, self.extent)
         self.ax_velocity.set_aspect('equal', adjustable='box')
         self.fig_velocity.tight_layout()
         self.canvas_velocity.draw()
@@ -309,8 +378,7 @@ class VelocityAnalysisTab(Frame):
     def display_unscaled_image(self):
         if self.img is None:
             return
-        self.ax_frame.clear()
-        self.ax_frame.imshow(self.img, origin='upper')
+        self.frame_view.set_image(self.img)
         self.ax_frame.set_title("Original Frame (pixels)")
         self.ax_frame.set_xlabel("X (pixels)")
         self.ax_frame.set_ylabel("Y (pixels)")
@@ -333,8 +401,10 @@ class VelocityAnalysisTab(Frame):
             self.display_scaled_image()
             # Clear previous selection and enable interactive point selection.
             self.selected_points = []
-            self.canvas_frame.mpl_connect('button_press_event', self.on_frame_click)
-            self.canvas_velocity.mpl_connect('button_press_event', self.on_velocity_click)
+            self.show_points()
+            if self.click_cids is None:
+                self.click_cids = (self.canvas_frame.mpl_connect('button_press_event', self.on_frame_click),
+                                   self.canvas_velocity.mpl_connect('button_press_event', self.on_velocity_click))
             self.status.config(text="Image rescaled. Click on the frame or velocity field to select two points.")
         except Exception as e:
             self.status.config(text=f"Error in rescaling: {e}")
@@ -342,8 +412,7 @@ class VelocityAnalysisTab(Frame):
     def display_scaled_image(self):
         if self.img is None or self.extent is None:
             return
-        self.ax_frame.clear()
-        self.ax_frame.imshow(self.img, extent=self.extent, origin='upper')
+        self.frame_view.set_image(self.img, self.extent)
         self.ax_frame.set_title("Rescaled Frame (meters)")
         self.ax_frame.set_xlabel("X (m)")
         self.ax_frame.set_ylabel("Y (m)")
@@ -361,34 +430,23 @@ class VelocityAnalysisTab(Frame):
             return
         self.add_point(event.xdata, event.ydata)
 
+    def show_points(self):
+        self.frame_marks.set_points(self.selected_points)
+        self.velocity_marks.set_points(self.selected_points)
+
     def add_point(self, x, y):
         self.selected_points.append((x, y))
-        self.ax_frame.plot(x, y, 'ro', markersize=8)
-        self.canvas_frame.draw()
-        self.ax_velocity.plot(x, y, 'ro', markersize=8)
-        self.canvas_velocity.draw()
+        self.show_points()
         if len(self.selected_points) == 2:
-            (x1, y1), (x2, y2) = self.selected_points
-            self.ax_frame.plot([x1, x2], [y1, y2], 'r--', lw=2)
-            self.ax_velocity.plot([x1, x2], [y1, y2], 'r--', lw=2)
-            self.canvas_frame.draw()
-            self.canvas_velocity.draw()
             self.analyze_btn.config(state=tk.NORMAL)
             self.status.config(text="Two points selected. Click 'Analyze Data'.")
 
     def clear_selection(self):
         self.selected_points = []
         self.analyze_btn.config(state=tk.DISABLED)
-        if self.extent is not None and self.img is not None:
-            self.display_scaled_image()
-        elif self.img is not None:
-            self.display_unscaled_image()
-        if self.vel is not None:
-            self.display_velocity_field()
-        self.ax_profile.clear()
-        self.ax_profile.set_title("Velocity Profile")
-        self.ax_profile.set_xlabel("Distance (m)")
-        self.ax_profile.set_ylabel("Velocity (m/s)")
+        self.discharge_btn.config(state=tk.DISABLED)
+        self.show_points()
+        self.profile_view.clear()
         self.fig_profile.tight_layout()
         self.canvas_profile.draw()
         self.status.config(text="Selection cleared.")
@@ -411,23 +469,9 @@ class VelocityAnalysisTab(Frame):
                     self.status.config(text="CSV must have at least two points.")
                     return
                 self.selected_points = df.iloc[:2, :].values.tolist()
-                if self.img is not None:
-                    if self.extent is not None:
-                        self.display_scaled_image()
-                    else:
-                        self.display_unscaled_image()
-                if self.vel is not None:
-                    self.display_velocity_field()
-                for x, y in self.selected_points:
-                    self.ax_frame.plot(x, y, 'ro', markersize=8)
-                    self.ax_velocity.plot(x, y, 'ro', markersize=8)
+                self.show_points()
                 if len(self.selected_points) == 2:
-                    (x1, y1), (x2, y2) = self.selected_points
-                    self.ax_frame.plot([x1, x2], [y1, y2], 'r--', lw=2)
-                    self.ax_velocity.plot([x1, x2], [y1, y2], 'r--', lw=2)
                     self.analyze_btn.config(state=tk.NORMAL)
-                self.canvas_frame.draw()
-                self.canvas_velocity.draw()
                 self.status.config(text=f"Reloaded points from {os.path.basename(pf)}")
             except Exception as e:
                 self.status.config(text=f"Error reloading points: {e}")
@@ -440,12 +484,7 @@ class VelocityAnalysisTab(Frame):
             return
         (x1, y1), (x2, y2) = self.selected_points
         num = 200
-        x_line = np.linspace(x1, x2, num)
-        y_line = np.linspace(y1, y2, num)
-        v_line = interp.griddata((self.X, self.Y), self.vel, (x_line, y_line), method='linear')
-        if np.any(np.isnan(v_line)):
-            v_line[np.isnan(v_line)] = interp.griddata((self.X, self.Y), self.vel, (x_line[np.isnan(v_line)], y_line[np.isnan(v_line)]), method='nearest')
-        dist = np.sqrt((x_line - x_line[0])**2 + (y_line - y_line[0])**2)
+        dist, v_line = self.sampler.transect((x1, y1), (x2, y2), num)
         mean_vel = np.nanmean(v_line)
         n_sections = simpledialog.askinteger("Number of Sections", "Enter number of sections:", minvalue=1, parent=self)
         if n_sections is None:
@@ -456,31 +495,46 @@ class VelocityAnalysisTab(Frame):
         sec_avg = [np.mean(sec) for sec in sections_v]
         sec_center = [np.mean(secd) for secd in sections_dist]
         self.status.config(text=f"Mean velocity: {mean_vel:.4f} m/s")
-        self.ax_profile.clear()
-        self.ax_profile.plot(dist, v_line, '-o', markersize=3, label='Interpolated Velocity')
-        self.ax_profile.set_xlabel("Distance (m)")
-        self.ax_profile.set_ylabel("Velocity (m/s)")
-        self.ax_profile.set_title("Velocity Profile")
-        self.ax_profile.axhline(mean_vel, color='red', linestyle='--', label=f"Mean = {mean_vel:.2f} m/s")
-        self.ax_profile.grid(True)
-        for i in range(1, n_sections):
-            self.ax_profile.axvline(x=sections_dist[i][0], color='gray', linestyle='--', alpha=0.5)
-        self.ax_profile.plot(sec_center, sec_avg, 'ks', markersize=8, label="Section Averages")
-        self.fig_profile.canvas.draw()
-        ylim = self.ax_profile.get_ylim()
-        offset = (ylim[1]-ylim[0]) * 0.03
-        for cen, avg in zip(sec_center, sec_avg):
-            self.ax_profile.text(cen, avg+offset, f"{avg:.2f}", fontsize=8, ha='center', va='bottom')
-        self.ax_profile.legend()
+        self.profile_view.set_profile(dist, v_line, mean_vel, sec_center, sec_avg,
+                                      [sections_dist[i][0] for i in range(1, n_sections)])
         self.fig_profile.tight_layout()
         self.canvas_profile.draw()
         df_cross = pd.DataFrame({"Distance (m)": dist, "Velocity (m/s)": v_line})
         df_cross.to_csv(os.path.join(self.save_dir, "velocity_cross_section.csv"), index=False)
-        df_sec = pd.DataFrame({"Section": list(range(1, n_sections+1)), "Section Center (m)": sec_center, "Average Velocity (m/s)": sec_avg})
+        # Section bounds tile the whole transect (same dividers as the profile plot) for the discharge step
+        sec_start = [sections_dist[0][0]] + [sections_dist[i][0] for i in range(1, n_sections)]
+        sec_end = sec_start[1:] + [dist[-1]]
+        df_sec = pd.DataFrame({"Section": list(range(1, n_sections+1)), "Section Center (m)": sec_center, "Average Velocity (m/s)": sec_avg,
+                               "Section Start (m)": sec_start, "Section End (m)": sec_end})
         df_sec.to_csv(os.path.join(self.save_dir, "section_average_velocities.csv"), index=False)
+        self.discharge_btn.config(state=tk.NORMAL)
         df_points = pd.DataFrame(self.selected_points, columns=["X", "Y"])
         df_points.to_csv(os.path.join(self.save_dir, "selected_points.csv"), index=False)
 
+    def compute_discharge(self):
+        sections = os.path.join(self.save_dir, "section_average_velocities.csv")
+        if not os.path.exists(sections):
+            self.status.config(text="Analyze a transect first (Step 5).")
+            return
+        depth_file = filedialog.askopenfilename(title="Select depth profile CSV (Distance (m), Depth (m) or Depth (cm))",
+                                        filetypes=[("CSV Files","*.csv")])
+        if not depth_file:
+            self.status.config(text="No depth profile selected.")
+            return
+        alpha = simpledialog.askfloat("Velocity Correction", "Surface-to-mean velocity factor:", initialvalue=ALPHA,
+                                      minvalue=0.1, maxvalue=1.5, parent=self)
+        if alpha is None:
+            self.status.config(text="Correction factor not provided.")
+            return
+        try:
+            depth_x, depth = read_depth(depth_file)
+            table, t = estimate(sections, depth_x, depth, alpha)
+            table.to_csv(os.path.join(self.save_dir, "discharge_sections.csv"), index=False)
+            self.status.config(text=f"Wetted area: {t['area']:.3f} m2 | Q = {t['q']:.3f} m3/s "
+                                    f"(p5-p95 {t['q_p5']:.3f}-{t['q_p95']:.3f}, alpha {alpha:.2f} +/- 0.05)")
+        except Exception as e:
+            self.status.config(text=f"Error computing discharge: {e}")
+
 def main():
     root = tk.Tk()
     root.title("River Surface Velocity Analyzer")
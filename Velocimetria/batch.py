@@ -0,0 +1,96 @@
+import argparse, os, sys, traceback
+import multiprocessing as mp
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import pandas as pd
+from pipeline import run_optical_flow, run_time_series
+from cache import ResultCache, DEFAULT_ROOT, DEFAULT_MAX_BYTES
+
+REQUIRED = ["video", "calibration_factor", "start_frame", "vlim"]
+
+def read_manifest(path):
+    df = pd.read_csv(path)
+    missing = [c for c in REQUIRED if c not in df.columns]
+    if missing:
+        raise ValueError(f"Manifest is missing columns: {missing}")
+    base = os.path.dirname(os.path.abspath(path))
+    jobs = []
+    for row in df.to_dict("records"):
+        job = {"video": os.path.join(base, str(row["video"])),
+               "calibration_factor": float(row["calibration_factor"]),
+               "start_frame": int(row["start_frame"]),
+               "vlim": float(row["vlim"])}
+        if pd.notna(row.get("end_frame", None)):
+            job["end_frame"] = int(row["end_frame"])
+        if pd.notna(row.get("fps", None)):
+            job["fps"] = float(row["fps"])
+        if pd.notna(row.get("output_dir", None)):
+            job["output_dir"] = os.path.join(base, str(row["output_dir"]))
+        jobs.append(job)
+    return jobs
+
+def job_output_dir(output_root, job, idx):
+    stem = os.path.splitext(os.path.basename(job["video"]))[0]
+    return job.get("output_dir") or os.path.join(output_root, f"{idx:03d}_{stem}_f{job['start_frame']}")
+
+def _run_job(job):
+    try:
+        if job.get("time_series"):
+            field = run_time_series(job["video"], job["calibration_factor"], job["vlim"], job["output_dir"],
+                                    start_frame=job["start_frame"], end_frame=job.get("end_frame"), pairs=job["pairs"],
+                                    workers=job["workers"], fps=job.get("fps"), field_format=job.get("field_format", "npy"),
+                                    log=lambda msg: None, cache=job.get("cache"))
+        else:
+            field = run_optical_flow(job["video"], job["calibration_factor"], job["start_frame"], job["vlim"],
+                                     job["output_dir"], fps=job.get("fps"), field_format=job.get("field_format", "npy"),
+                                     log=lambda msg: None, cache=job.get("cache"))
+        return dict(job, status="ok", field=field, error="")
+    except (Exception, SystemExit) as e:  # opyf calls sys.exit() on invalid frame plans
+        with open(os.path.join(job["output_dir"], "error.log"), "w") as f:
+            f.write(traceback.format_exc())
+        msg = str(e) or "opyf aborted the run (is start_frame within the video?)"
+        return dict(job, status="error", field="", error=f"{type(e).__name__}: {msg}")
+
+def run_batch(jobs, output_root, workers=None, field_format="npy", time_series=False, pairs=8, cache=None, log=print):
+    jobs = [dict(job, output_dir=job_output_dir(output_root, job, i), field_format=field_format, cache=cache)
+            for i, job in enumerate(jobs)]
+    for job in jobs:
+        os.makedirs(job["output_dir"], exist_ok=True)
+    report = lambda n, res: log(f"[{n}/{len(jobs)}] {res['status']}: {os.path.basename(res['video'])} {res['error']}")
+    results = []
+    if time_series:
+        # Videos run one after another; the pool is spent on frame windows within each video
+        for n, job in enumerate(jobs, 1):
+            results.append(_run_job(dict(job, time_series=True, pairs=pairs, workers=workers)))
+            report(n, results[-1])
+    else:
+        with ProcessPoolExecutor(max_workers=workers, mp_context=mp.get_context("spawn")) as pool:
+            futures = {pool.submit(_run_job, job): job for job in jobs}
+            for n, fut in enumerate(as_completed(futures), 1):
+                results.append(fut.result())
+                report(n, results[-1])
+    summary = pd.DataFrame(results).drop(columns="cache").sort_values("output_dir")
+    os.makedirs(output_root, exist_ok=True)
+    summary.to_csv(os.path.join(output_root, "batch_summary.csv"), index=False)
+    return summary
+
+def main(argv=None):
+    p = argparse.ArgumentParser(description="Headless opyf velocimetry over a manifest of videos.")
+    p.add_argument("manifest", help="CSV with columns video, calibration_factor, start_frame, vlim [, end_frame, fps, output_dir]")
+    p.add_argument("-o", "--output", default="velocimetry_batch", help="Root directory for per-video outputs")
+    p.add_argument("-j", "--workers", type=int, default=max(1, (os.cpu_count() or 2) // 2),
+                   help="Number of videos (or frame windows with --time-series) processed concurrently")
+    p.add_argument("--format", choices=["npy", "csv", "both"], default="npy",
+                   help="Velocity field output: memory-mappable store, averaged CSV, or both")
+    p.add_argument("--time-series", action="store_true",
+                   help="Split each video from start_frame to end_frame into windows and build a time-indexed field")
+    p.add_argument("--pairs", type=int, default=8, help="Frame pairs per window in --time-series mode")
+    p.add_argument("--no-cache", action="store_true", help="Always rerun opyf instead of reusing cached results")
+    p.add_argument("--cache-dir", default=DEFAULT_ROOT, help="Result cache directory")
+    p.add_argument("--cache-gb", type=float, default=DEFAULT_MAX_BYTES / 2**30, help="Result cache size limit")
+    args = p.parse_args(argv)
+    cache = None if args.no_cache else ResultCache(args.cache_dir, int(args.cache_gb * 2**30))
+    summary = run_batch(read_manifest(args.manifest), args.output, args.workers, args.format, args.time_series, args.pairs, cache)
+    return 0 if (summary["status"] == "ok").all() else 1
+
+if __name__ == "__main__":
+    sys.exit(main())
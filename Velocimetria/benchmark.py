@@ -0,0 +1,188 @@
+import argparse, os, sys, time, platform, subprocess, tempfile
+import numpy as np
+import pandas as pd
+import cv2
+import matplotlib
+matplotlib.use('Agg')
+import matplotlib.pyplot as plt
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from pipeline import analyze, field_arrays, write_outputs
+from fieldstore import open_field
+from instrument import Trace
+from sampling import FieldSampler
+from render import FieldView, ProfileView
+
+# Synthetic river-surface videos: Gaussian tracers advected by a known parabolic
+# (Poiseuille-like) streamwise profile u(row) = umax * (1 - ((row - H/2) / (H/2))^2) px/frame.
+# Every stage of the Script.py chain is timed on them and the recovered field is
+# compared against that ground truth.
+CASES = {
+    "quick": [dict(width=480, height=270, frames=40, density=0.004)],
+    "default": [dict(width=w, height=h, frames=n, density=d)
+                for (w, h) in [(640, 360), (1280, 720), (1920, 1080)]
+                for n in [40, 120]
+                for d in [0.002, 0.008]],
+}
+CALIBRATION = 0.01  # m/px
+FPS = 30.0
+UMAX_PX = 3.0       # px/frame at the centreline
+
+def true_u_px(row, height, umax=UMAX_PX):
+    eta = (row - height / 2) / (height / 2)
+    return umax * np.clip(1 - eta**2, 0, None)
+
+def synth_video(path, width, height, frames, density, umax=UMAX_PX, fps=FPS, seed=0):
+    rng = np.random.default_rng(seed)
+    n = max(int(width * height * density), 1)
+    x, y = rng.uniform(0, width, n), rng.uniform(0, height, n)
+    radius = rng.uniform(1.5, 3.5, n)
+    shade = rng.uniform(120, 255, n)
+    u = true_u_px(y, height, umax)
+    background = cv2.GaussianBlur((rng.random((height, width)) * 40 + 40).astype(np.uint8), (0, 0), 3)
+    out = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*"MJPG"), fps, (width, height))
+    for _ in range(frames):
+        img = background.copy()
+        for xi, yi, ri, si in zip(x, y, radius, shade):
+            cv2.circle(img, (int(round(xi * 4)), int(round(yi * 4))), int(round(ri * 4)), float(si), -1, cv2.LINE_AA, shift=2)
+        out.write(cv2.cvtColor(cv2.GaussianBlur(img, (0, 0), 0.8), cv2.COLOR_GRAY2BGR))
+        x = (x + u) % width
+    out.release()
+    return path
+
+def time_decode(path):
+    cap = cv2.VideoCapture(path)
+    t0, n = time.perf_counter(), 0
+    while cap.read()[0]:
+        n += 1
+    cap.release()
+    return time.perf_counter() - t0, n
+
+def accuracy(arrays, height, umax=UMAX_PX, fps=FPS, cf=CALIBRATION, margin=0.1):
+    # Compare the window-averaged streamwise velocity on the opyf grid with the imposed profile
+    ux = np.nanmean(arrays["ux"], axis=0)
+    uy = np.nanmean(arrays["uy"], axis=0)
+    rows = height - np.asarray(arrays["y"]) / cf
+    truth = np.broadcast_to((true_u_px(rows, height, umax) * cf * fps)[:, None], ux.shape)
+    x = np.asarray(arrays["x"]) / cf
+    keep = np.isfinite(ux) & (rows[:, None] > margin * height) & (rows[:, None] < (1 - margin) * height)
+    keep &= (x[None, :] > margin * x.max()) & (x[None, :] < (1 - margin) * x.max())
+    err = ux[keep] - truth[keep]
+    return {"rmse_m_s": float(np.sqrt(np.mean(err**2))) if err.size else np.nan,
+            "bias_m_s": float(np.mean(err)) if err.size else np.nan,
+            "rel_rmse": float(np.sqrt(np.mean(err**2)) / (umax * cf * fps)) if err.size else np.nan,
+            "cross_rms_m_s": float(np.sqrt(np.nanmean(uy[keep]**2))) if err.size else np.nan,
+            "coverage": float(keep.sum() / max(np.isfinite(truth).sum(), 1))}
+
+def time_sampling(X, Y, V, n_transects=200, num=200, seed=0):
+    rng = np.random.default_rng(seed)
+    t0 = time.perf_counter()
+    sampler = FieldSampler(X, Y, V)
+    t1 = time.perf_counter()
+    lo, hi = [np.nanmin(X), np.nanmin(Y)], [np.nanmax(X), np.nanmax(Y)]
+    sampler.transects(rng.uniform(lo, hi, (n_transects, 2)), rng.uniform(lo, hi, (n_transects, 2)), num)
+    return t1 - t0, time.perf_counter() - t1
+
+def time_render(X, Y, V):
+    fig = plt.Figure(figsize=(6, 5), dpi=100)
+    ax = fig.add_subplot(111)
+    canvas = FigureCanvasAgg(fig)
+    view = FieldView(fig, ax)
+    t0 = time.perf_counter()
+    view.set_field(X, Y, V)
+    canvas.draw()
+    t_field = time.perf_counter() - t0
+    fig_p = plt.Figure(figsize=(10, 4), dpi=100)
+    profile = ProfileView(fig_p.add_subplot(111))
+    canvas_p = FigureCanvasAgg(fig_p)
+    d = np.linspace(0, 1, 200)
+    t0 = time.perf_counter()
+    profile.set_profile(d, np.sin(d), 0.5, [0.25, 0.75], [0.3, 0.6], [0.5])
+    canvas_p.draw()
+    return t_field, time.perf_counter() - t0
+
+def run_case(case, workdir, pairs=8):
+    video = synth_video(os.path.join(workdir, "synth_{width}x{height}_{frames}f_{density}.avi".format(**case)), **case)
+    row = dict(case)
+    row["decode_s"], row["decoded_frames"] = time_decode(video)
+    trace = Trace("bench")
+    starts = range(0, case["frames"] - (2 + pairs - 1), pairs)
+    parts = []
+    for s in starts:
+        v = analyze(video, CALIBRATION, s, 20, FPS, preview=False, vec_time=dict(Ntot=pairs), trace=trace)
+        parts.append(field_arrays(v))
+    arrays = dict(parts[0], ux=np.concatenate([p["ux"] for p in parts]), uy=np.concatenate([p["uy"] for p in parts]),
+                  time=np.concatenate([p["time"] for p in parts]), frames=np.concatenate([p["frames"] for p in parts]))
+    for rec in trace.stages.values():
+        row[f"{rec['name']}_s"] = rec["self_s"]
+    row["optical_flow_s"] = sum(rec["wall_s"] for rec in trace.stages.values() if rec["parent"] is None)
+    row["vectors"] = trace.stages["filtering"].get("vectors_out", 0)
+    row["peak_rss_mb"] = trace.to_dict()["peak_rss_mb"]
+    out = os.path.join(workdir, "out")
+    t0 = time.perf_counter()
+    write_outputs(out, arrays, "npy")
+    row["field_write_s"] = time.perf_counter() - t0
+    field = open_field(os.path.join(out, "velocity_field"))
+    t0 = time.perf_counter()
+    field.to_csv(os.path.join(out, "velocity_field.csv"))
+    row["csv_write_s"] = time.perf_counter() - t0
+    X, Y, Ux, Uy = field.points()
+    vel = np.hypot(Ux, Uy)
+    row["sampler_build_s"], row["sampling_200x200_s"] = time_sampling(X, Y, vel)
+    row["render_field_s"], row["render_profile_s"] = time_render(X, Y, vel)
+    row.update(accuracy(arrays, case["height"]))
+    return row
+
+def git_version():
+    try:
+        return subprocess.check_output(["git", "describe", "--always", "--dirty"], cwd=os.path.dirname(os.path.abspath(__file__)),
+                                       stderr=subprocess.DEVNULL, text=True).strip()
+    except Exception:
+        return "unknown"
+
+def run_suite(cases, output, keep_videos=None):
+    stamp = dict(version=git_version(), timestamp=time.strftime("%Y-%m-%dT%H:%M:%S"), host=platform.node(),
+                 python=platform.python_version(), opencv=cv2.__version__)
+    rows = []
+    with tempfile.TemporaryDirectory(prefix="velbench_") as tmp:
+        workdir = keep_videos or tmp
+        os.makedirs(workdir, exist_ok=True)
+        for i, case in enumerate(cases, 1):
+            row = dict(stamp, **run_case(case, workdir))
+            rows.append(row)
+            print(f"[{i}/{len(cases)}] {case['width']}x{case['height']} {case['frames']}f d={case['density']}: "
+                  f"optical flow {row['optical_flow_s']:.2f}s "
+                  f"rel_rmse={row['rel_rmse']:.3f}")
+    df = pd.DataFrame(rows)
+    # Successive versions accumulate in one table so compare() can line them up
+    history = pd.read_csv(output) if os.path.exists(output) else None
+    pd.concat([history, df], ignore_index=True).to_csv(output, index=False)
+    return df
+
+def compare(path, base=None, head=None):
+    df = pd.read_csv(path)
+    versions = list(dict.fromkeys(df["version"]))
+    base, head = base or versions[0], head or versions[-1]
+    keys = ["width", "height", "frames", "density"]
+    metrics = [c for c in df.columns if c.endswith("_s") or c in ("rel_rmse", "peak_rss_mb")]
+    a = df[df["version"] == base].groupby(keys)[metrics].median()
+    b = df[df["version"] == head].groupby(keys)[metrics].median()
+    ratio = (b / a).dropna(how="all")
+    print(f"{head} / {base} (median per case, >1 means slower or worse)")
+    print(ratio.round(2).to_string())
+    return ratio
+
+def main(argv=None):
+    p = argparse.ArgumentParser(description="Synthetic-video benchmark for the velocimetry chain.")
+    p.add_argument("--cases", choices=sorted(CASES), default="quick")
+    p.add_argument("-o", "--output", default="bench_results.csv", help="CSV the results are appended to")
+    p.add_argument("--keep-videos", help="Directory to keep the generated videos in")
+    p.add_argument("--compare", action="store_true", help="Compare the first and last versions stored in --output")
+    args = p.parse_args(argv)
+    if args.compare:
+        compare(args.output)
+    else:
+        run_suite(CASES[args.cases], args.output, args.keep_videos)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
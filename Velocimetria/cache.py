@@ -0,0 +1,163 @@
+import argparse, hashlib, json, os, shutil, sys, time
+
+# Content-addressed cache of optical-flow outputs. An entry is keyed by the SHA-256 of the
+# video bytes plus every parameter handed to opyf (see pipeline.opyf_params), so moving or
+# renaming a video still hits while re-encoding it or changing any parameter misses.
+# Layout: <root>/entries/<key>/{entry.json, velocity_field/..., ...} and <root>/digests/, one
+# file per (path, size, mtime) remembering the video digest so large files are hashed once.
+# One file per video means concurrent batch workers never rewrite each other's entries.
+CACHE_VERSION = 1
+DEFAULT_ROOT = os.environ.get("VELOCIMETRIA_CACHE", os.path.join(os.path.expanduser("~"), ".cache", "velocimetria"))
+DEFAULT_MAX_BYTES = 4 * 2**30
+ENTRY = "entry.json"
+
+def file_digest(path, chunk=2**22):
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(chunk), b""):
+            h.update(block)
+    return h.hexdigest()
+
+def _read_json(path, default=None):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return default
+
+def _write_json(path, data):
+    # Write-then-rename so concurrent batch workers never see a half-written file
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "w") as f:
+        json.dump(data, f, indent=2, default=str)
+    os.replace(tmp, path)
+
+def _copy(src, dst):
+    if os.path.isdir(src):
+        shutil.copytree(src, dst, dirs_exist_ok=True)
+    else:
+        os.makedirs(os.path.dirname(dst) or ".", exist_ok=True)
+        shutil.copy2(src, dst)
+
+def _tree_bytes(path):
+    if os.path.isfile(path):
+        return os.path.getsize(path)
+    return sum(os.path.getsize(os.path.join(d, f)) for d, _, files in os.walk(path) for f in files)
+
+class ResultCache:
+    def __init__(self, root=DEFAULT_ROOT, max_bytes=DEFAULT_MAX_BYTES):
+        self.root = root
+        self.max_bytes = max_bytes
+        os.makedirs(os.path.join(root, "entries"), exist_ok=True)
+
+    def video_digest(self, path):
+        st = os.stat(path)
+        tag = f"{os.path.abspath(path)}|{st.st_size}|{st.st_mtime_ns}"
+        record_path = os.path.join(self.root, "digests", hashlib.sha256(tag.encode()).hexdigest()[:32] + ".json")
+        record = _read_json(record_path)
+        if record is None or record.get("tag") != tag:
+            record = {"tag": tag, "sha256": file_digest(path)}
+            os.makedirs(os.path.dirname(record_path), exist_ok=True)
+            _write_json(record_path, record)
+        return record["sha256"]
+
+    def key(self, video_path, params):
+        payload = {"cache_version": CACHE_VERSION, "video": self.video_digest(video_path), "params": params}
+        return hashlib.sha256(json.dumps(payload, sort_keys=True, default=str).encode()).hexdigest()
+
+    def _entry(self, key):
+        return os.path.join(self.root, "entries", key)
+
+    def get(self, key, output_dir):
+        # Copies a cached entry into output_dir and returns its record, or None on a miss
+        entry = self._entry(key)
+        record = _read_json(os.path.join(entry, ENTRY))
+        if record is None:
+            return None
+        try:
+            for name in record["files"]:
+                _copy(os.path.join(entry, name), os.path.join(output_dir, name))
+        except OSError:  # evicted or damaged meanwhile
+            return None
+        record["last_used"] = time.time()
+        record["hits"] = record.get("hits", 0) + 1
+        _write_json(os.path.join(entry, ENTRY), record)
+        return record
+
+    def put(self, key, output_dir, files, video=None, meta=None):
+        entry = self._entry(key)
+        tmp = f"{entry}.{os.getpid()}.tmp"
+        shutil.rmtree(tmp, ignore_errors=True)
+        files = [f for f in files if os.path.exists(os.path.join(output_dir, f))]
+        for name in files:
+            _copy(os.path.join(output_dir, name), os.path.join(tmp, name))
+        now = time.time()
+        record = {"key": key, "video": video and os.path.abspath(video),
+                  "video_sha256": video and self.video_digest(video), "files": files,
+                  "bytes": _tree_bytes(tmp), "created": now, "last_used": now, "hits": 0, **(meta or {})}
+        _write_json(os.path.join(tmp, ENTRY), record)
+        shutil.rmtree(entry, ignore_errors=True)
+        try:
+            os.replace(tmp, entry)
+        except OSError:  # another worker stored the same key first
+            shutil.rmtree(tmp, ignore_errors=True)
+        self.evict()
+        return record
+
+    def entries(self):
+        base = os.path.join(self.root, "entries")
+        records = [_read_json(os.path.join(base, k, ENTRY)) for k in os.listdir(base) if not k.endswith(".tmp")]
+        return sorted((r for r in records if r), key=lambda r: r["last_used"])
+
+    def size(self):
+        return sum(r["bytes"] for r in self.entries())
+
+    def evict(self, max_bytes=None):
+        # Drops least-recently-used entries until the cache fits in max_bytes
+        limit = self.max_bytes if max_bytes is None else max_bytes
+        records = self.entries()
+        total = sum(r["bytes"] for r in records)
+        removed = []
+        for r in records:
+            if total <= limit:
+                break
+            shutil.rmtree(self._entry(r["key"]), ignore_errors=True)
+            total -= r["bytes"]
+            removed.append(r["key"])
+        return removed
+
+    def invalidate(self, key=None, video=None):
+        # Removes one entry, every entry computed from a video, or (no arguments) the whole cache
+        if key is None and video is None:
+            removed = [r["key"] for r in self.entries()]
+        elif key is not None:
+            removed = [key] if os.path.exists(self._entry(key)) else []
+        else:
+            digest = file_digest(video) if os.path.exists(video) else None
+            path = os.path.abspath(video)
+            removed = [r["key"] for r in self.entries() if r.get("video") == path or (digest and r.get("video_sha256") == digest)]
+        for k in removed:
+            shutil.rmtree(self._entry(k), ignore_errors=True)
+        return removed
+
+def main(argv=None):
+    p = argparse.ArgumentParser(description="Inspect or clear the optical-flow result cache.")
+    p.add_argument("command", choices=["info", "clear", "evict"])
+    p.add_argument("--dir", default=DEFAULT_ROOT, help="Cache directory (default: $VELOCIMETRIA_CACHE or ~/.cache/velocimetria)")
+    p.add_argument("--video", help="With clear: only drop entries computed from this video")
+    p.add_argument("--max-gb", type=float, default=DEFAULT_MAX_BYTES / 2**30, help="With evict: size to shrink the cache to")
+    args = p.parse_args(argv)
+    cache = ResultCache(args.dir, int(args.max_gb * 2**30))
+    if args.command == "info":
+        for r in cache.entries():
+            print(f"{r['key'][:12]}  {r['bytes'] / 2**20:8.1f} MB  hits={r['hits']:<3d} "
+                  f"{time.strftime('%Y-%m-%d %H:%M', time.localtime(r['last_used']))}  {r.get('video')}")
+        print(f"{cache.size() / 2**20:.1f} MB in {args.dir}")
+    elif args.command == "clear":
+        print(f"Removed {len(cache.invalidate(video=args.video))} entries")
+    else:
+        print(f"Evicted {len(cache.evict())} entries")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,134 @@
+import argparse, os, sys
+import numpy as np
+import pandas as pd
+
+# Cross-section discharge from the section-average surface velocities of the analysis tab
+# (section_average_velocities.csv) and a measured or synthetic depth profile. Same math as the
+# enhanced-bathymetry app (trapezoidal area between stations, Q = A * k * v_surface per section),
+# but on arrays: depth may carry leading batch axes (Monte-Carlo draws) and velocity leading
+# axes (time windows, transects, draws), so thousands of evaluations are a single call.
+# Distances are measured from the first transect point, as in the analysis tab.
+ALPHA = 0.85
+
+def synthetic_depth(width, max_depth, shape=2.0, n=41):
+    # Symmetric section: 2 is parabolic, larger values approach a rectangle
+    x = np.linspace(0.0, width, n)
+    return x, max_depth * (1 - np.abs(2 * x / width - 1) ** shape)
+
+def wetted_area(edges, depth_x, depth):
+    # Exact area of the piecewise-linear bed between consecutive edges. depth_x: (m,) stations,
+    # depth: (..., m) in metres (negative values are dry), edges: (s + 1,). Returns (..., s).
+    x = np.asarray(depth_x, dtype=float)
+    d = np.clip(np.asarray(depth, dtype=float), 0, None)
+    e = np.clip(np.asarray(edges, dtype=float), x[0], x[-1])
+    cum = np.cumsum(np.diff(x) * (d[..., 1:] + d[..., :-1]) / 2, axis=-1)
+    cum = np.concatenate([np.zeros(d.shape[:-1] + (1,)), cum], axis=-1)
+    k = np.clip(np.searchsorted(x, e, side="right") - 1, 0, len(x) - 2)
+    dx = e - x[k]
+    de = d[..., k] + dx / (x[k + 1] - x[k]) * (d[..., k + 1] - d[..., k])
+    return np.diff(cum[..., k] + dx * (d[..., k] + de) / 2, axis=-1)
+
+def discharge(edges, depth_x, depth, velocity, alpha=ALPHA):
+    # Per-section (area, Q) with Q = area * alpha * velocity. velocity: (..., s) surface velocities;
+    # alpha broadcasts against velocity without its section axis. Totals are .sum(-1).
+    area = wetted_area(edges, depth_x, depth)
+    q = area * (np.asarray(alpha, dtype=float)[..., None] * np.asarray(velocity, dtype=float))
+    return area, q
+
+def monte_carlo(edges, depth_x, depth, velocity, n=2000, alpha=ALPHA, alpha_sd=0.05, calibration_sd=0.0,
+                velocity_sd=0.0, depth_sd=0.0, stage_sd=0.0, seed=None):
+    # n perturbed evaluations in one call. Errors are normal: alpha (absolute), calibration factor
+    # (relative, common to all sections), section velocity (relative, independent), station depth
+    # (metres, independent) and water stage (metres, common to all stations).
+    # velocity: (s,) or (t, s). Returns (area (n, s), q (n, [t,] s)).
+    rng = np.random.default_rng(seed)
+    velocity = np.asarray(velocity, dtype=float)
+    depth = np.asarray(depth, dtype=float)
+    lead = (n,) + (1,) * (velocity.ndim - 1)
+    depth = depth + depth_sd * rng.standard_normal((n, depth.shape[-1])) + stage_sd * rng.standard_normal((n, 1))
+    v = velocity * (1 + calibration_sd * rng.standard_normal(lead + (1,))) * (1 + velocity_sd * rng.standard_normal((n,) + velocity.shape))
+    area = wetted_area(edges, depth_x, depth)
+    q = area.reshape((n,) + (1,) * (velocity.ndim - 1) + area.shape[-1:]) * (alpha + alpha_sd * rng.standard_normal(lead))[..., None] * v
+    return area, q
+
+def bands(samples, percentiles=(5, 50, 95)):
+    return np.percentile(samples, percentiles, axis=0)
+
+def read_sections(path):
+    # (edges, velocity) from section_average_velocities.csv. Files without the start/end columns
+    # (older versions of the analysis tab) get edges halfway between section centres.
+    df = pd.read_csv(path)
+    v = df["Average Velocity (m/s)"].to_numpy(dtype=float)
+    if "Section Start (m)" in df.columns:
+        return np.append(df["Section Start (m)"].to_numpy(dtype=float), df["Section End (m)"].iloc[-1]), v
+    c = df["Section Center (m)"].to_numpy(dtype=float)
+    mid = (c[1:] + c[:-1]) / 2
+    last = 2 * c[-1] - mid[-1] if len(c) > 1 else 2 * c[-1]
+    return np.concatenate([[0.0], mid, [last]]), v
+
+def read_depth(path):
+    # Distance column "Distance (m)", depth column "Depth (m)" or "Depth (cm)" (the bathymetry app unit)
+    df = pd.read_csv(path)
+    dist = next(c for c in df.columns if c.lower().startswith("distance"))
+    col = next(c for c in df.columns if c.lower().startswith("depth"))
+    df = df.sort_values(dist)
+    x = df[dist].to_numpy(dtype=float)
+    if np.any(np.diff(x) <= 0):
+        raise ValueError(f"{path}: repeated distances in the depth profile")
+    d = df[col].to_numpy(dtype=float)
+    return x, d / 100 if "(cm)" in col.lower() else d
+
+def section_table(edges, velocity, area, q, alpha=ALPHA, q_samples=None):
+    df = pd.DataFrame({"Section": np.arange(1, len(velocity) + 1),
+                       "Section Start (m)": edges[:-1], "Section End (m)": edges[1:],
+                       "Surface Velocity (m/s)": velocity, "Mean Velocity (m/s)": alpha * np.asarray(velocity),
+                       "Area (m2)": area, "Discharge (m3/s)": q})
+    if q_samples is not None:
+        df["Discharge p5 (m3/s)"], df["Discharge p95 (m3/s)"] = bands(q_samples, (5, 95))
+    return df
+
+def estimate(sections_csv, depth_x, depth, alpha=ALPHA, n=2000, seed=None, **errors):
+    # Nominal per-section table plus Monte-Carlo bands; returns (table, totals dict)
+    edges, v = read_sections(sections_csv)
+    area, q = discharge(edges, depth_x, depth, v, alpha)
+    sample_area, sample_q = monte_carlo(edges, depth_x, depth, v, n, alpha, seed=seed, **errors)
+    lo, mid, hi = bands(sample_q.sum(-1))
+    totals = {"area": area.sum(), "q": q.sum(), "q_p5": lo, "q_p50": mid, "q_p95": hi,
+              "area_p5": np.percentile(sample_area.sum(-1), 5), "area_p95": np.percentile(sample_area.sum(-1), 95)}
+    return section_table(edges, v, area, q, alpha, sample_q), totals
+
+def main(argv=None):
+    p = argparse.ArgumentParser(description="Discharge from section surface velocities and a depth profile.")
+    p.add_argument("sections", help="section_average_velocities.csv from the analysis tab")
+    p.add_argument("--depth", help="CSV with Distance (m) and Depth (m) or Depth (cm)")
+    p.add_argument("--width", type=float, help="Synthetic section width (m), instead of --depth")
+    p.add_argument("--max-depth", type=float, help="Synthetic section maximum depth (m)")
+    p.add_argument("--shape", type=float, default=2.0, help="Synthetic section exponent (2 = parabolic)")
+    p.add_argument("--alpha", type=float, default=ALPHA, help="Surface-to-mean velocity factor")
+    p.add_argument("--alpha-sd", type=float, default=0.05)
+    p.add_argument("--calibration-sd", type=float, default=0.0, help="Relative error of the calibration factor")
+    p.add_argument("--velocity-sd", type=float, default=0.0, help="Relative error of each section velocity")
+    p.add_argument("--depth-sd", type=float, default=0.0, help="Error of each depth station (m)")
+    p.add_argument("--stage-sd", type=float, default=0.0, help="Error of the water level (m)")
+    p.add_argument("-n", "--samples", type=int, default=2000, help="Monte-Carlo draws")
+    p.add_argument("--seed", type=int, default=None)
+    p.add_argument("-o", "--output", default=None, help="Per-section CSV (default: discharge_sections.csv next to the input)")
+    args = p.parse_args(argv)
+    if args.depth:
+        depth_x, depth = read_depth(args.depth)
+    elif args.width and args.max_depth:
+        depth_x, depth = synthetic_depth(args.width, args.max_depth, args.shape)
+    else:
+        p.error("give --depth or both --width and --max-depth")
+    table, t = estimate(args.sections, depth_x, depth, args.alpha, args.samples, args.seed,
+                        alpha_sd=args.alpha_sd, calibration_sd=args.calibration_sd, velocity_sd=args.velocity_sd,
+                        depth_sd=args.depth_sd, stage_sd=args.stage_sd)
+    out = args.output or os.path.join(os.path.dirname(os.path.abspath(args.sections)), "discharge_sections.csv")
+    table.to_csv(out, index=False)
+    print(f"Wetted area: {t['area']:.3f} m2 (p5-p95 {t['area_p5']:.3f}-{t['area_p95']:.3f})")
+    print(f"Discharge: {t['q']:.3f} m3/s (p5-p95 {t['q_p5']:.3f}-{t['q_p95']:.3f})")
+    print(f"Sections: {out}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,75 @@
+import os, json
+import numpy as np
+import pandas as pd
+
+# Time-resolved velocity fields on the opyf rectilinear grid, stored as a directory of
+# .npy arrays plus a small field.json index:
+#   x.npy (nx,), y.npy (ny,)          grid axes in metres
+#   ux.npy, uy.npy (nt, ny, nx)       float32 components, one slab per frame window
+#   time.npy (nt,), frames.npy (nt,2) window mid-time in seconds and its frame pair
+# The component arrays are memory-mapped on open, so selecting a few windows or a
+# bounding box only touches those pages.
+INDEX = "field.json"
+UX_COL, UY_COL = "Ux_[m.s^{-1}]", "Uy_[m.s-1]"
+
+def write_field(path, x, y, ux, uy, time, frames=None, meta=None):
+    os.makedirs(path, exist_ok=True)
+    ux = np.asarray(ux, dtype=np.float32).reshape(-1, len(y), len(x))
+    uy = np.asarray(uy, dtype=np.float32).reshape(-1, len(y), len(x))
+    time = np.asarray(time, dtype=np.float64).reshape(-1)
+    if frames is None:
+        frames = np.full((len(time), 2), -1)
+    for name, arr in [("x", np.asarray(x, dtype=np.float64)), ("y", np.asarray(y, dtype=np.float64)),
+                      ("ux", ux), ("uy", uy), ("time", time), ("frames", np.asarray(frames, dtype=np.int64).reshape(-1, 2))]:
+        np.save(os.path.join(path, name + ".npy"), arr)
+    index = {"version": 1, "nt": int(ux.shape[0]), "ny": len(y), "nx": len(x), "units": ["m", "s"], **(meta or {})}
+    with open(os.path.join(path, INDEX), "w") as f:
+        json.dump(index, f, indent=2)
+    return path
+
+def is_field(path):
+    return os.path.basename(path) == INDEX or os.path.exists(os.path.join(path, INDEX))
+
+def open_field(path, mmap=True):
+    return VelocityField(os.path.dirname(path) if os.path.basename(path) == INDEX else path, mmap=mmap)
+
+class VelocityField:
+    def __init__(self, path, mmap=True):
+        self.path = path
+        with open(os.path.join(path, INDEX)) as f:
+            self.meta = json.load(f)
+        mode = "r" if mmap else None
+        load = lambda name, m=None: np.load(os.path.join(path, name + ".npy"), mmap_mode=m)
+        self.x, self.y, self.time, self.frames = load("x"), load("y"), load("time"), load("frames")
+        self.ux, self.uy = load("ux", mode), load("uy", mode)
+
+    def __len__(self):
+        return len(self.time)
+
+    def windows(self, t0=None, t1=None):
+        sel = np.nonzero((self.time >= (-np.inf if t0 is None else t0)) & (self.time <= (np.inf if t1 is None else t1)))[0]
+        return slice(sel[0], sel[-1] + 1) if len(sel) else slice(0, 0)
+
+    def _axis_slice(self, axis, lo, hi):
+        sel = np.nonzero((axis >= lo) & (axis <= hi))[0]
+        return slice(sel[0], sel[-1] + 1) if len(sel) else slice(0, 0)
+
+    def subset(self, windows=slice(None), bbox=None):
+        # bbox = (xmin, xmax, ymin, ymax); returns x, y, ux, uy with ux/uy shaped (nt, ny, nx)
+        sx, sy = slice(None), slice(None)
+        if bbox is not None:
+            sx, sy = self._axis_slice(self.x, bbox[0], bbox[1]), self._axis_slice(self.y, bbox[2], bbox[3])
+        if isinstance(windows, (int, np.integer)):
+            windows = slice(windows, windows + 1)
+        return self.x[sx], self.y[sy], np.asarray(self.ux[windows, sy, sx]), np.asarray(self.uy[windows, sy, sx])
+
+    def points(self, windows=slice(None), bbox=None):
+        # Flat X, Y, Ux, Uy in opyf CSV order (rows of Y, X varying fastest), averaged over the selected windows
+        x, y, ux, uy = self.subset(windows, bbox)
+        X, Y = np.tile(x, len(y)), np.repeat(y, len(x))
+        return X, Y, np.nanmean(ux, axis=0).ravel(), np.nanmean(uy, axis=0).ravel()
+
+    def to_csv(self, path, windows=slice(None), bbox=None):
+        X, Y, Ux, Uy = self.points(windows, bbox)
+        pd.DataFrame({"X": X, "Y": Y, UX_COL: Ux, UY_COL: Uy}).to_csv(path, index=False)
+        return path
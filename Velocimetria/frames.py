@@ -0,0 +1,128 @@
+import threading
+from collections import OrderedDict
+import cv2
+
+# Frame source for the scrubber: an LRU cache of display-resized frames bounded by
+# max_bytes, sequential decoding instead of seeking for short forward jumps, and a
+# background thread that prefetches frames in the direction the slider moves.
+class FrameProvider:
+    def __init__(self, video_path, display_size=(800, 600), max_bytes=256 * 2**20, prefetch=12, max_forward_skip=48):
+        self.cap = cv2.VideoCapture(video_path)
+        if not self.cap.isOpened():
+            raise IOError(f"Cannot open video {video_path}")
+        self.video_path = video_path
+        self.total_frames = int(self.cap.get(cv2.CAP_PROP_FRAME_COUNT))
+        self.fps = self.cap.get(cv2.CAP_PROP_FPS)
+        self.frame_size = (int(self.cap.get(cv2.CAP_PROP_FRAME_WIDTH)), int(self.cap.get(cv2.CAP_PROP_FRAME_HEIGHT)))
+        self.display_size = display_size
+        self.max_bytes = max_bytes
+        self.prefetch = prefetch
+        self.max_forward_skip = max_forward_skip
+        self._cache = OrderedDict()
+        self._bytes = 0
+        self._cache_lock = threading.Lock()
+        self._decode_lock = threading.Lock()
+        self._pos = -1  # index of the frame the next cap.read() returns, -1 if unknown
+        self._last = 0
+        self._target = None
+        self._wake = threading.Event()
+        self._interrupt = threading.Event()
+        self._closed = False
+        self._thread = threading.Thread(target=self._prefetch_loop, daemon=True)
+        self._thread.start()
+
+    def get(self, idx, schedule=True):
+        # schedule=False fetches a side frame (e.g. the preview partner) without steering the prefetcher
+        idx = min(max(int(idx), 0), max(self.total_frames - 1, 0))
+        frame = self._lookup(idx)
+        if frame is None:
+            self._interrupt.set()
+            with self._decode_lock:
+                self._interrupt.clear()
+                frame = self._lookup(idx)
+                if frame is None:
+                    frame = self._decode_range(idx, idx)
+        if schedule:
+            self._schedule(idx)
+        return frame
+
+    def read_full(self, idx):
+        # Full-resolution frame, bypassing the cache (used for saving frames)
+        with self._decode_lock:
+            self.cap.set(cv2.CAP_PROP_POS_FRAMES, idx)
+            ret, frame = self.cap.read()
+            self._pos = idx + 1 if ret else -1
+        return frame if ret else None
+
+    def cached_bytes(self):
+        return self._bytes
+
+    def close(self):
+        self._closed = True
+        self._interrupt.set()
+        self._wake.set()
+        self._thread.join(timeout=1)
+        with self._decode_lock:
+            self.cap.release()
+        with self._cache_lock:
+            self._cache.clear()
+            self._bytes = 0
+
+    def _lookup(self, idx):
+        with self._cache_lock:
+            frame = self._cache.get(idx)
+            if frame is not None:
+                self._cache.move_to_end(idx)
+            return frame
+
+    def _store(self, idx, frame):
+        with self._cache_lock:
+            if idx in self._cache:
+                return
+            self._cache[idx] = frame
+            self._bytes += frame.nbytes
+            while self._bytes > self.max_bytes and len(self._cache) > 1:
+                _, old = self._cache.popitem(last=False)
+                self._bytes -= old.nbytes
+
+    def _decode_range(self, start, stop, abort=None):
+        # Caller holds _decode_lock. Decodes start..stop inclusive, caching each frame.
+        if not (0 <= self._pos <= start <= self._pos + self.max_forward_skip):
+            self.cap.set(cv2.CAP_PROP_POS_FRAMES, start)
+            self._pos = start
+        frame = None
+        while self._pos <= stop:
+            if abort is not None and abort.is_set():
+                return None
+            ret, full = self.cap.read()
+            if not ret:
+                self._pos = -1
+                return None
+            frame = self._lookup(self._pos)
+            if frame is None:
+                frame = cv2.resize(full, self.display_size, interpolation=cv2.INTER_AREA)
+                self._store(self._pos, frame)
+            self._pos += 1
+        return frame
+
+    def _schedule(self, idx):
+        step = 1 if idx >= self._last else -1
+        self._last = idx
+        self._target = (idx, step)
+        self._wake.set()
+
+    def _prefetch_loop(self):
+        while not self._closed:
+            self._wake.wait()
+            self._wake.clear()
+            if self._closed or self._target is None:
+                continue
+            idx, step = self._target
+            ahead = [j for j in range(idx + step, idx + step * (self.prefetch + 1), step)
+                     if 0 <= j < self.total_frames and self._lookup(j) is None]
+            if not ahead:
+                continue
+            with self._decode_lock:
+                if self._wake.is_set() or self._interrupt.is_set():
+                    continue
+                self._decode_range(min(ahead), max(ahead), abort=self._interrupt)
@@ -0,0 +1,107 @@
+import json, sys, time
+from contextlib import contextmanager
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+def peak_rss_mb():
+    if resource is not None:
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak / 2**20 if sys.platform == "darwin" else peak / 2**10
+    if psutil is not None:
+        info = psutil.Process().memory_info()
+        return getattr(info, "peak_wset", info.rss) / 2**20
+    return None
+
+class Trace:
+    # Per-run record of wall time, peak RSS and counters for each pipeline stage.
+    # Stages may nest (self_s excludes time spent in child stages) and may be entered
+    # many times, in which case calls, times and counters accumulate.
+    def __init__(self, name="run", log=None):
+        self.name = name
+        self.log = log
+        self.meta = {}
+        self.stages = {}
+        self.children = []
+        self._stack = []
+        self._t0 = time.perf_counter()
+
+    @contextmanager
+    def stage(self, name, quiet=False, **counts):
+        rec = self.stages.setdefault(name, {"name": name, "calls": 0, "wall_s": 0.0, "self_s": 0.0,
+                                            "parent": self._stack[-1][0] if self._stack else None})
+        frame = [name, 0.0]
+        self._stack.append(frame)
+        t0 = time.perf_counter()
+        try:
+            yield rec
+        finally:
+            dt = time.perf_counter() - t0
+            self._stack.pop()
+            if self._stack:
+                self._stack[-1][1] += dt
+            rec["calls"] += 1
+            rec["wall_s"] += dt
+            rec["self_s"] += dt - frame[1]
+            rec["peak_rss_mb"] = peak_rss_mb()
+            self.count(name, **counts)
+            if self.log and not quiet:
+                self.log(f"{name} done ({dt:.2f}s)")
+
+    def count(self, name, **counts):
+        rec = self.stages[name]
+        for k, v in counts.items():
+            rec[k] = rec.get(k, 0) + v
+
+    def to_dict(self):
+        return {"name": self.name, **self.meta, "total_s": time.perf_counter() - self._t0,
+                "peak_rss_mb": peak_rss_mb(), "stages": list(self.stages.values()), "children": self.children}
+
+    def save(self, path):
+        with open(path, "w") as f:
+            json.dump(self.to_dict(), f, indent=2, default=float)
+        return path
+
+def instrument_analyzer(video, trace):
+    # Wraps the per-pair opyf steps on this instance so their time and vector counts land in the trace
+    step, filters, interp = video.stepGoodFeaturesToTrackandOpticalFlow, video.applyFilters, video.interpolateOnGrid
+
+    def step_wrapped(pr, i):
+        with trace.stage("feature_extraction", quiet=True, frames=1):
+            return step(pr, i)
+
+    def filters_wrapped(X, V):
+        with trace.stage("filtering", quiet=True, vectors_in=len(X)):
+            X, V = filters(X, V)
+        trace.count("filtering", vectors_out=len(X))
+        return X, V
+
+    def interp_wrapped(X, V):
+        with trace.stage("interpolation", quiet=True, vectors=len(X)) as rec:
+            rec["grid_points"] = len(video.XT)
+            return interp(X, V)
+
+    video.stepGoodFeaturesToTrackandOpticalFlow = step_wrapped
+    video.applyFilters = filters_wrapped
+    video.interpolateOnGrid = interp_wrapped
+    return video
+
+def summarize_children(children):
+    # Sum stage times and counters across child traces (e.g. the windows of a time series)
+    summed = ("calls", "wall_s", "self_s", "frames", "vectors", "vectors_in", "vectors_out")
+    total = {}
+    for child in children:
+        for rec in child["stages"]:
+            agg = total.setdefault(rec["name"], {"name": rec["name"]})
+            for k in summed:
+                if k in rec:
+                    agg[k] = agg.get(k, 0) + rec[k]
+            if rec.get("peak_rss_mb") is not None:
+                agg["peak_rss_mb"] = max(agg.get("peak_rss_mb", 0), rec["peak_rss_mb"])
+    return list(total.values())
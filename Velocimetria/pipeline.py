@@ -0,0 +1,210 @@
+import os, json
+import multiprocessing as mp
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+import cv2
+import matplotlib
+from fieldstore import write_field, open_field
+from instrument import Trace, instrument_analyzer, summarize_children
+
+VEC_TIME = dict(Ntot=8, shift=1, step=2)
+FILTER_PARAMS = dict(wayBackGoodFlag=4, RadiusF=20, maxDevInRadius=1, CLAHE=True)
+FEATURE_PARAMS = dict(maxCorners=40000, qualityLevel=0.005)
+FLOW_PARAMS = dict(maxLevel=3)
+
+def video_fps(video_path, default=30.0):
+    cap = cv2.VideoCapture(video_path)
+    try:
+        fps = cap.get(cv2.CAP_PROP_FPS) if cap.isOpened() else 0
+    finally:
+        cap.release()
+    return fps if fps and fps > 0 else default
+
+def field_arrays(video):
+    # opyf keeps one interpolated grid per frame pair in UxTot/UyTot
+    if len(video.UxTot) == 0:
+        raise RuntimeError("opyf produced no interpolated velocity field")
+    return dict(x=video.vecX, y=video.vecY, ux=np.asarray(video.UxTot), uy=np.asarray(video.UyTot),
+                time=video.Time, frames=np.asarray(video.vec).reshape(-1, 2))
+
+def write_outputs(output_dir, arrays, field_format="npy", meta=None):
+    # field_format: "npy" (memory-mappable store), "csv" (window-averaged opyf-style CSV) or "both"
+    field_path = write_field(os.path.join(output_dir, "velocity_field"), meta=meta, **arrays)
+    if field_format in ("csv", "both"):
+        csv_path = open_field(field_path).to_csv(os.path.join(output_dir, "velocity_field.csv"))
+        if field_format == "csv":
+            return csv_path
+    return field_path
+
+def opyf_params(calibration_factor, start_frame, vlim, fps, vec_time=None, filter_params=None,
+                feature_params=None, flow_params=None):
+    # Every argument handed to the opyf setters and scaleData; analyze() applies exactly these
+    # and the result cache keys on them
+    return {"set_vecTime": dict(VEC_TIME, **(vec_time or {}), starting_frame=start_frame),
+            "set_vlim": [0, vlim],
+            "set_filtersParams": dict(FILTER_PARAMS, **(filter_params or {})),
+            "set_goodFeaturesToTrackParams": dict(FEATURE_PARAMS, **(feature_params or {})),
+            "set_opticalFlowParams": dict(FLOW_PARAMS, **(flow_params or {})),
+            "scaleData": dict(framesPerSecond=fps, metersPerPx=calibration_factor, unit=['m','s'])}
+
+def analyze(video_path, calibration_factor, start_frame, vlim, fps, preview=True, vec_time=None,
+            filter_params=None, feature_params=None, flow_params=None, trace=None, log=print):
+    # Runs the opyf chain on one frame window and returns the scaled videoAnalyzer
+    matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+    import opyf
+    trace = trace or Trace(log=log)
+    params = opyf_params(calibration_factor, start_frame, vlim, fps, vec_time, filter_params, feature_params, flow_params)
+    with trace.stage("video_open") as rec:
+        video = opyf.videoAnalyzer(video_path, display=False)
+        video.set_vecTime(**params["set_vecTime"])
+        rec.update(width=int(video.Lvis), height=int(video.Hvis), frames_in_video=int(video.number_of_frames))
+    if preview:
+        with trace.stage("preview"):
+            video.extractGoodFeaturesAndDisplacements(display=None, displayColor=False, width=0.002)
+            plt.close('all')
+            video.set_vlim(params["set_vlim"])
+            video.extractGoodFeaturesAndDisplacements(display=None, displayColor=False, width=0.002)
+            plt.close('all')
+    else:
+        video.set_vlim(params["set_vlim"])
+    video.set_filtersParams(**params["set_filtersParams"])
+    video.set_goodFeaturesToTrackParams(**params["set_goodFeaturesToTrackParams"])
+    video.set_opticalFlowParams(**params["set_opticalFlowParams"])
+    instrument_analyzer(video, trace)
+    with trace.stage("flow_and_interpolation"):
+        video.extractGoodFeaturesPositionsDisplacementsAndInterpolate(display=None, displayColor=False, scale=10, width=0.005)
+        plt.close('all')
+    with trace.stage("scaling", fps=fps):
+        video.scaleData(origin=[0, video.Hvis], **params["scaleData"])
+    video.cap.release()
+    return video
+
+def write_run(output_dir, run):
+    with open(os.path.join(output_dir, "run.json"), "w") as f:
+        json.dump(run, f, indent=2)
+
+def from_cache(cache, key, output_dir, field_format, run, trace):
+    # Restores a cached run into output_dir; returns the field path, or None on a miss
+    with trace.stage("cache_lookup", quiet=True) as rec:
+        hit = cache.get(key, output_dir)
+        rec["hit"] = hit is not None
+    if hit is None:
+        return None
+    out = os.path.join(output_dir, "velocity_field")
+    if field_format in ("csv", "both"):
+        csv_path = open_field(out).to_csv(os.path.join(output_dir, "velocity_field.csv"))
+        if field_format == "csv":
+            out = csv_path
+    write_run(output_dir, dict(run, cache_key=key, cached=True))
+    trace.meta["run"] = dict(run, cache_key=key, cached=True)
+    trace.save(os.path.join(output_dir, "trace.json"))
+    if trace.log:
+        trace.log(f"cache hit {key[:12]}, opyf skipped")
+    return out
+
+def run_optical_flow(video_path, calibration_factor, start_frame, vlim, output_dir, fps=None, preview=True,
+                     vec_time=None, filter_params=None, feature_params=None, flow_params=None, field_format="npy",
+                     log=print, trace=None, cache=None):
+    # cache: a cache.ResultCache; runs with identical video content and opyf parameters are restored from it
+    os.makedirs(output_dir, exist_ok=True)
+    trace = trace or Trace(os.path.basename(video_path), log=log)
+    fps = fps or video_fps(video_path)
+    vt = dict(VEC_TIME, **(vec_time or {}))
+    run = {"video": os.path.abspath(video_path), "fps": fps, "calibration_factor": calibration_factor,
+           "start_frame": start_frame, "vlim": vlim, **{k: int(v) for k, v in vt.items()}}
+    key = None
+    if cache is not None:
+        params = opyf_params(calibration_factor, start_frame, vlim, fps, vt, filter_params, feature_params, flow_params)
+        key = cache.key(video_path, {"mode": "single", **params})
+        out = from_cache(cache, key, output_dir, field_format, run, trace)
+        if out is not None:
+            return out
+    video = analyze(video_path, calibration_factor, start_frame, vlim, fps, preview, vt,
+                    filter_params, feature_params, flow_params, trace)
+    with trace.stage("write") as rec:
+        arrays = field_arrays(video)
+        out = write_outputs(output_dir, arrays, field_format, meta={"run": run})
+        video.writeImageProcessingParamsJSON(outFolder=output_dir)
+        if key is not None:
+            cache.put(key, output_dir, ["velocity_field", "params_image_processing.json"], video_path, {"run": run})
+            run = dict(run, cache_key=key, cached=False)
+        write_run(output_dir, run)
+        rec.update(windows=int(len(arrays["time"])), grid_points=int(arrays["ux"][0].size))
+    trace.meta["run"] = run
+    trace.save(os.path.join(output_dir, "trace.json"))
+    return out
+
+def plan_windows(total_frames, start_frame=0, end_frame=None, pairs=8, step=2, shift=1):
+    # Starting frames of consecutive opyf windows of `pairs` frame pairs covering [start_frame, end_frame)
+    end_frame = total_frames if end_frame is None else min(end_frame, total_frames)
+    span = step + (pairs - 1) * shift  # last frame offset read by a window
+    return list(range(start_frame, end_frame - span, pairs * shift))
+
+def _analyze_window(job):
+    # Worker entry point: opyf seeks straight to the window, so each process decodes only its own frames
+    trace = Trace(f"window_{job['start_frame']}")
+    video = analyze(job["video"], job["calibration_factor"], job["start_frame"], job["vlim"], job["fps"],
+                    preview=False, vec_time=job["vec_time"], trace=trace, **job["params"])
+    return field_arrays(video), trace.to_dict()
+
+def merge_windows(parts):
+    parts = sorted(parts, key=lambda a: a["time"][0])
+    return dict(x=parts[0]["x"], y=parts[0]["y"],
+                ux=np.concatenate([a["ux"] for a in parts]), uy=np.concatenate([a["uy"] for a in parts]),
+                time=np.concatenate([a["time"] for a in parts]), frames=np.concatenate([a["frames"] for a in parts]))
+
+def surface_velocity_series(arrays):
+    # Spatial mean of the velocity magnitude per frame window, i.e. a surface-velocity hydrograph
+    mag = np.hypot(arrays["ux"], arrays["uy"])
+    return pd.DataFrame({"time_s": arrays["time"], "frame_a": arrays["frames"][:, 0], "frame_b": arrays["frames"][:, 1],
+                         "mean_velocity_m_s": np.nanmean(mag, axis=(1, 2)),
+                         "median_velocity_m_s": np.nanmedian(mag, axis=(1, 2))})
+
+def run_time_series(video_path, calibration_factor, vlim, output_dir, start_frame=0, end_frame=None, pairs=8,
+                    workers=None, fps=None, vec_time=None, filter_params=None, feature_params=None, flow_params=None,
+                    field_format="npy", log=print, trace=None, cache=None):
+    os.makedirs(output_dir, exist_ok=True)
+    trace = trace or Trace(os.path.basename(video_path), log=log)
+    fps = fps or video_fps(video_path)
+    vt = dict(VEC_TIME, **(vec_time or {}), Ntot=pairs)
+    cap = cv2.VideoCapture(video_path)
+    total = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+    cap.release()
+    starts = plan_windows(total, start_frame, end_frame, pairs, vt["step"], vt["shift"])
+    if not starts:
+        raise ValueError(f"No complete {pairs}-pair window fits between frames {start_frame} and {end_frame or total}")
+    params = dict(filter_params=filter_params, feature_params=feature_params, flow_params=flow_params)
+    run = {"video": os.path.abspath(video_path), "fps": fps, "calibration_factor": calibration_factor,
+           "start_frame": start_frame, "end_frame": end_frame, "vlim": vlim, "windows": len(starts),
+           **{k: int(v) for k, v in vt.items()}, **{k: v for k, v in params.items() if v}}
+    key = None
+    if cache is not None:
+        key = cache.key(video_path, {"mode": "time_series", "window_starts": starts,
+                                     **opyf_params(calibration_factor, None, vlim, fps, vt, **params)})
+        out = from_cache(cache, key, output_dir, field_format, run, trace)
+        if out is not None:
+            return out
+    jobs = [dict(video=video_path, calibration_factor=calibration_factor, start_frame=s, vlim=vlim, fps=fps,
+                 vec_time=vt, params=params) for s in starts]
+    parts = []
+    with trace.stage("windows", windows=len(jobs)):
+        with ProcessPoolExecutor(max_workers=workers, mp_context=mp.get_context("spawn")) as pool:
+            for n, (part, child) in enumerate(pool.map(_analyze_window, jobs), 1):
+                parts.append(part)
+                trace.children.append(child)
+                if trace.log:
+                    trace.log(f"window {n}/{len(jobs)} done (frames {part['frames'][0, 0]}-{part['frames'][-1, 1]})")
+    with trace.stage("merge"):
+        arrays = merge_windows(parts)
+    with trace.stage("write", windows=len(arrays["time"])):
+        out = write_outputs(output_dir, arrays, field_format, meta={"run": run})
+        surface_velocity_series(arrays).to_csv(os.path.join(output_dir, "surface_velocity_series.csv"), index=False)
+        if key is not None:
+            cache.put(key, output_dir, ["velocity_field", "surface_velocity_series.csv"], video_path, {"run": run})
+            run = dict(run, cache_key=key, cached=False)
+        write_run(output_dir, run)
+    trace.meta.update(run=run, window_stages=summarize_children(trace.children))
+    trace.save(os.path.join(output_dir, "trace.json"))
+    return out
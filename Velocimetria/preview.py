@@ -0,0 +1,69 @@
+from collections import OrderedDict
+import numpy as np
+import cv2
+
+# Live sparse-flow preview for the frame scrubber: Lucas-Kanade between the current frame
+# and one `gap` frames later, on a region of interest shrunk to at most max_side pixels and
+# with a fixed corner budget, so the per-frame cost does not grow with the video resolution.
+# Grayscale pyramids of recently seen frames are kept so that scrubbing back and forth
+# does not redo the conversion.
+class SparseFlowPreview:
+    def __init__(self, max_corners=300, max_side=480, win=15, levels=2, quality=0.01, min_distance=7, cached=32):
+        self.max_corners = max_corners
+        self.max_side = max_side
+        self.lk = dict(winSize=(win, win), maxLevel=levels,
+                       criteria=(cv2.TERM_CRITERIA_EPS | cv2.TERM_CRITERIA_COUNT, 20, 0.03))
+        self.features = dict(maxCorners=max_corners, qualityLevel=quality, minDistance=min_distance, blockSize=7)
+        self.roi = None  # (x, y, w, h) in display pixels, None for the whole frame
+        self._gray = OrderedDict()
+        self._cached = cached
+
+    def set_roi(self, roi):
+        self.roi = tuple(int(v) for v in roi) if roi is not None and roi[2] > 0 and roi[3] > 0 else None
+        self._gray.clear()
+
+    def _prepare(self, idx, frame):
+        # Cropped, shrunk grayscale of one frame plus the factor back to display pixels
+        hit = self._gray.get(idx)
+        if hit is not None:
+            self._gray.move_to_end(idx)
+            return hit
+        x, y, w, h = self.roi or (0, 0, frame.shape[1], frame.shape[0])
+        crop = frame[y:y + h, x:x + w]
+        scale = min(1.0, self.max_side / max(crop.shape[:2]))
+        if scale < 1.0:
+            crop = cv2.resize(crop, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+        gray = cv2.cvtColor(crop, cv2.COLOR_BGR2GRAY) if crop.ndim == 3 else crop
+        self._gray[idx] = hit = (gray, scale)
+        if len(self._gray) > self._cached:
+            self._gray.popitem(last=False)
+        return hit
+
+    def compute(self, idx_a, frame_a, idx_b, frame_b):
+        # Returns (points, displacements), both (n, 2) in display pixels of frame_a
+        (ga, scale), (gb, _) = self._prepare(idx_a, frame_a), self._prepare(idx_b, frame_b)
+        p0 = cv2.goodFeaturesToTrack(ga, mask=None, **self.features)
+        if p0 is None:
+            return np.empty((0, 2)), np.empty((0, 2))
+        p1, st, _ = cv2.calcOpticalFlowPyrLK(ga, gb, p0, None, **self.lk)
+        # Forward-backward check drops features that do not track back to where they started
+        back, st_b, _ = cv2.calcOpticalFlowPyrLK(gb, ga, p1, None, **self.lk)
+        ok = (st.ravel() == 1) & (st_b.ravel() == 1) & (np.abs(p0 - back).reshape(-1, 2).max(axis=1) < 1.0)
+        origin = np.array(self.roi[:2] if self.roi else (0, 0), dtype=float)
+        pts = p0.reshape(-1, 2)[ok] / scale + origin
+        return pts, (p1 - p0).reshape(-1, 2)[ok] / scale
+
+def draw_vectors(frame, pts, disp, gain=4.0, vmax=None, roi=None):
+    # Arrows coloured by magnitude (jet, 0..vmax) over a copy of the frame
+    out = frame.copy()
+    if roi is not None:
+        cv2.rectangle(out, (roi[0], roi[1]), (roi[0] + roi[2], roi[1] + roi[3]), (255, 255, 255), 1)
+    if len(pts) == 0:
+        return out
+    mag = np.hypot(disp[:, 0], disp[:, 1])
+    vmax = vmax or max(float(mag.max()), 1e-6)
+    colors = cv2.applyColorMap(np.clip(mag / vmax * 255, 0, 255).astype(np.uint8).reshape(-1, 1), cv2.COLORMAP_JET).reshape(-1, 3)
+    ends = pts + disp * gain
+    for (x0, y0), (x1, y1), c in zip(pts.astype(int), ends.astype(int), colors.tolist()):
+        cv2.arrowedLine(out, (x0, y0), (x1, y1), c, 1, cv2.LINE_AA, tipLength=0.3)
+    return out
@@ -0,0 +1,133 @@
+import numpy as np
+
+# Persistent-artist views for the analysis tab: artists are created once and their data
+# is swapped in place, so reloading fields or points never stacks new artists/colorbars.
+
+def bin_to_screen(X, Y, V, ax, max_points=20000):
+    # Average points falling in the same screen cell when the cloud is denser than max_points
+    X, Y, V = np.asarray(X, dtype=float), np.asarray(Y, dtype=float), np.asarray(V, dtype=float)
+    ok = np.isfinite(X) & np.isfinite(Y) & np.isfinite(V)
+    if ok.sum() <= max_points:
+        return X, Y, V
+    X, Y, V = X[ok], Y[ok], V[ok]
+    bbox = ax.get_window_extent()
+    px = max(2.0, np.sqrt(bbox.width * bbox.height / max_points))
+    nx, ny = max(int(bbox.width / px), 1), max(int(bbox.height / px), 1)
+    x0, y0 = X.min(), Y.min()
+    ix = np.minimum(((X - x0) / (np.ptp(X) or 1) * nx).astype(int), nx - 1)
+    iy = np.minimum(((Y - y0) / (np.ptp(Y) or 1) * ny).astype(int), ny - 1)
+    cell = iy * nx + ix
+    n = np.bincount(cell, minlength=nx * ny)
+    occ = n > 0
+    mean = lambda w: np.bincount(cell, weights=w, minlength=nx * ny)[occ] / n[occ]
+    return mean(X), mean(Y), mean(V)
+
+class ImageView:
+    def __init__(self, ax):
+        self.ax = ax
+        self.image = None
+
+    def set_image(self, img, extent=None):
+        h, w = img.shape[:2]
+        extent = extent if extent is not None else (-0.5, w - 0.5, h - 0.5, -0.5)
+        if self.image is None:
+            self.image = self.ax.imshow(img, extent=extent, origin='upper')
+        else:
+            self.image.set_data(img)
+            self.image.set_extent(extent)
+        self.ax.set_xlim(extent[0], extent[1])
+        self.ax.set_ylim(extent[2], extent[3])
+
+class FieldView:
+    def __init__(self, fig, ax, cmap="plasma", label="Velocity (m/s)", max_points=20000):
+        self.ax = ax
+        self.max_points = max_points
+        self.scatter = ax.scatter([], [], c=[], cmap=cmap, alpha=0.8, s=15)
+        self.colorbar = fig.colorbar(self.scatter, ax=ax, label=label)
+
+    def set_field(self, X, Y, V, extent=None):
+        x, y, v = bin_to_screen(X, Y, V, self.ax, self.max_points)
+        self.scatter.set_offsets(np.column_stack([x, y]))
+        self.scatter.set_array(v)
+        self.scatter.set_clim(np.nanmin(v), np.nanmax(v))
+        if extent is not None:
+            self.ax.set_xlim(extent[0], extent[1])
+            self.ax.set_ylim(extent[2], extent[3])
+        else:
+            self.ax.set_xlim(np.nanmin(x), np.nanmax(x))
+            self.ax.set_ylim(np.nanmin(y), np.nanmax(y))
+
+class TransectOverlay:
+    # Transect markers drawn as animated artists and blitted over a cached background
+    def __init__(self, ax, canvas):
+        self.ax = ax
+        self.canvas = canvas
+        self.points, = ax.plot([], [], 'ro', markersize=8, animated=True)
+        self.line, = ax.plot([], [], 'r--', lw=2, animated=True)
+        self._background = None
+        canvas.mpl_connect('draw_event', self._on_draw)
+
+    def _on_draw(self, event):
+        self._background = self.canvas.copy_from_bbox(self.ax.bbox)
+        self._draw_artists()
+
+    def _draw_artists(self):
+        self.ax.draw_artist(self.points)
+        self.ax.draw_artist(self.line)
+
+    def set_points(self, pts):
+        xs, ys = [p[0] for p in pts], [p[1] for p in pts]
+        self.points.set_data(xs, ys)
+        self.line.set_data(xs if len(pts) == 2 else [], ys if len(pts) == 2 else [])
+        self.update()
+
+    def update(self):
+        if self._background is None:
+            self.canvas.draw()
+            return
+        self.canvas.restore_region(self._background)
+        self._draw_artists()
+        self.canvas.blit(self.ax.bbox)
+
+class ProfileView:
+    def __init__(self, ax):
+        self.ax = ax
+        self.line, = ax.plot([], [], '-o', markersize=3, label='Interpolated Velocity')
+        self.mean = ax.axhline(0, color='red', linestyle='--', visible=False)
+        self.sections, = ax.plot([], [], 'ks', markersize=8, label="Section Averages")
+        self.dividers = ax.vlines([], 0, 1, color='gray', linestyle='--', alpha=0.5, transform=ax.get_xaxis_transform())
+        self.labels = []
+        self.legend = None
+        ax.set_title("Velocity Profile")
+        ax.set_xlabel("Distance (m)")
+        ax.set_ylabel("Velocity (m/s)")
+        ax.grid(True)
+
+    def set_profile(self, dist, v, mean_vel, centers, averages, bounds):
+        self.line.set_data(dist, v)
+        self.mean.set_ydata([mean_vel, mean_vel])
+        self.mean.set_label(f"Mean = {mean_vel:.2f} m/s")
+        self.mean.set_visible(True)
+        self.sections.set_data(centers, averages)
+        self.dividers.set_segments([[(b, 0), (b, 1)] for b in bounds])
+        self.ax.relim(visible_only=True)
+        self.ax.autoscale_view()
+        ylim = self.ax.get_ylim()
+        offset = (ylim[1] - ylim[0]) * 0.03
+        for t in self.labels:
+            t.remove()
+        self.labels = [self.ax.text(c, a + offset, f"{a:.2f}", fontsize=8, ha='center', va='bottom')
+                       for c, a in zip(centers, averages)]
+        self.legend = self.ax.legend(handles=[self.line, self.mean, self.sections])
+
+    def clear(self):
+        self.line.set_data([], [])
+        self.sections.set_data([], [])
+        self.mean.set_visible(False)
+        self.dividers.set_segments([])
+        for t in self.labels:
+            t.remove()
+        self.labels = []
+        if self.legend is not None:
+            self.legend.remove()
+            self.legend = None
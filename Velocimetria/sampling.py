@@ -0,0 +1,50 @@
+import numpy as np
+from scipy.interpolate import LinearNDInterpolator
+from scipy.spatial import Delaunay, cKDTree
+
+# Same results as griddata(method='linear') with a griddata(method='nearest') fallback
+# outside the convex hull, but the Delaunay triangulation and KD-tree are built once
+# per point cloud and reused for every transect and every reload of the same grid.
+class FieldSampler:
+    def __init__(self, X, Y, values):
+        self.points = np.column_stack([np.asarray(X, dtype=float), np.asarray(Y, dtype=float)])
+        self.tri = Delaunay(self.points)
+        self.tree = cKDTree(self.points)
+        self.set_values(values)
+
+    def same_points(self, X, Y):
+        return len(X) == len(self.points) and np.array_equal(self.points[:, 0], X) and np.array_equal(self.points[:, 1], Y)
+
+    def set_values(self, values):
+        self.values = np.asarray(values, dtype=float)
+        self.linear = LinearNDInterpolator(self.tri, self.values)
+
+    def sample(self, x, y):
+        x, y = np.asarray(x, dtype=float), np.asarray(y, dtype=float)
+        v = self.linear(x.ravel(), y.ravel())
+        nan = np.isnan(v)
+        if nan.any():
+            _, idx = self.tree.query(np.column_stack([x.ravel()[nan], y.ravel()[nan]]))
+            v[nan] = self.values[idx]
+        return v.reshape(x.shape)
+
+    def transects(self, starts, ends, num=200):
+        # starts, ends: (n, 2) arrays of section endpoints. Returns distance along each
+        # section and sampled values, both shaped (n, num).
+        starts, ends = np.atleast_2d(starts).astype(float), np.atleast_2d(ends).astype(float)
+        t = np.linspace(0, 1, num)
+        x = starts[:, :1] + (ends[:, :1] - starts[:, :1]) * t
+        y = starts[:, 1:] + (ends[:, 1:] - starts[:, 1:]) * t
+        dist = np.hypot(x - x[:, :1], y - y[:, :1])
+        return dist, self.sample(x, y)
+
+    def transect(self, p1, p2, num=200):
+        dist, v = self.transects([p1], [p2], num)
+        return dist[0], v[0]
+
+def update_sampler(sampler, X, Y, values):
+    # Reuse the triangulation when a reload brings the same grid (the usual opyf case)
+    if sampler is not None and sampler.same_points(X, Y):
+        sampler.set_values(values)
+        return sampler
+    return FieldSampler(X, Y, values)
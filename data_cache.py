@@ -0,0 +1,264 @@
+import argparse, hashlib, json, os, re, shutil, sys, threading, time, urllib.error, urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+# Caché de descargas compartido por los notebooks (Cauce_Principal, LULC_Analysis, ...).
+# Cada archivo se guarda una sola vez por contenido (objects/<sha256>) y urls.json recuerda qué
+# contenido corresponde a cada URL, así que con la caché caliente no se toca la red (funciona sin
+# conexión). Las descargas interrumpidas se reanudan con HTTP Range desde partial/, el formato se
+# valida con los primeros bytes (antes de bajar el resto) y los punteros de Git LFS se detectan y
+# se resuelven contra media.githubusercontent.com, verificando el oid del puntero.
+# Los archivos se entregan como enlaces (o copias) con su nombre original en files/<sha>/ o en
+# la ruta pedida, porque GDAL necesita la extensión para reconocer GPKG y shapefiles.
+DEFAULT_ROOT = os.environ.get("ECOCIENCIA_CACHE", os.path.join(os.path.expanduser("~"), ".cache", "ecociencia"))
+OFFLINE = os.environ.get("ECOCIENCIA_OFFLINE", "") not in ("", "0")
+CHUNK = 2**20
+LFS_POINTER = b"version https://git-lfs.github.com/spec/"
+SHAPEFILE_PARTS = (".shp", ".shx", ".dbf", ".prj", ".cpg", ".qix", ".fix")
+SHAPEFILE_REQUIRED = (".shp", ".shx", ".dbf")
+# Primeros bytes esperados por extensión
+MAGIC = {
+    ".gpkg": (b"SQLite format 3\x00",),
+    ".tif": (b"II*\x00", b"MM\x00*", b"II+\x00", b"MM\x00+"),
+    ".tiff": (b"II*\x00", b"MM\x00*", b"II+\x00", b"MM\x00+"),
+    ".shp": (b"\x00\x00\x27\x0a",),
+    ".shx": (b"\x00\x00\x27\x0a",),
+    ".zip": (b"PK\x03\x04",),
+}
+
+def to_raw(url):
+    # Enlaces "blob" de GitHub -> contenido crudo
+    return url.replace("github.com/", "raw.githubusercontent.com/").replace("/blob/", "/") if "github.com/" in url and "/blob/" in url else url
+
+def to_media(url):
+    # raw.githubusercontent.com/<dueño>/<repo>/<rama>/<ruta> -> archivo real detrás de un puntero LFS
+    m = re.match(r"https?://raw\.githubusercontent\.com/([^/]+)/([^/]+)/(.+)", url)
+    return f"https://media.githubusercontent.com/media/{m.group(1)}/{m.group(2)}/{m.group(3)}" if m else None
+
+def lfs_oid(head):
+    m = re.search(rb"oid sha256:([0-9a-f]{64})", head)
+    return m.group(1).decode() if m else None
+
+def validate(head, name):
+    # Lanza ValueError si los primeros bytes no corresponden al formato que indica la extensión
+    if head.startswith(LFS_POINTER):
+        raise ValueError(f"{name}: es un puntero de Git LFS, no el archivo")
+    ext = os.path.splitext(name)[1].lower()
+    if ext in MAGIC and not head.startswith(MAGIC[ext]):
+        raise ValueError(f"{name}: no parece un archivo {ext} válido (primeros bytes {head[:16]!r})")
+
+def file_digest(path):
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(4 * CHUNK), b""):
+            h.update(block)
+    return h.hexdigest()
+
+def _read_json(path, default=None):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return default
+
+def _write_json(path, data):
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "w") as f:
+        json.dump(data, f, indent=2)
+    os.replace(tmp, path)
+
+def _link(src, dst):
+    # Enlace duro si se puede (no ocupa espacio), copia si no
+    os.makedirs(os.path.dirname(os.path.abspath(dst)), exist_ok=True)
+    if os.path.exists(dst):
+        if os.path.samefile(src, dst):
+            return dst
+        os.remove(dst)
+    try:
+        os.link(src, dst)
+    except OSError:
+        shutil.copy2(src, dst)
+    return dst
+
+class DataCache:
+    def __init__(self, root=DEFAULT_ROOT, offline=OFFLINE, timeout=60, log=None):
+        self.root = root
+        self.offline = offline
+        self.timeout = timeout
+        self.log = log
+        for d in ("objects", "partial", "files"):
+            os.makedirs(os.path.join(root, d), exist_ok=True)
+        self.index_path = os.path.join(root, "urls.json")
+        self._lock = threading.Lock()
+
+    def _object(self, sha):
+        return os.path.join(self.root, "objects", sha)
+
+    def lookup(self, url):
+        # Registro de una URL ya descargada, o None
+        record = _read_json(self.index_path, {}).get(to_raw(url))
+        return record if record and os.path.exists(self._object(record["sha256"])) else None
+
+    def _remember(self, url, record):
+        with self._lock:
+            index = _read_json(self.index_path, {})
+            index[url] = record
+            _write_json(self.index_path, index)
+
+    def _download(self, url, name):
+        # Descarga a partial/ reanudando lo que haya; devuelve (ruta parcial, primeros 512 bytes)
+        part = os.path.join(self.root, "partial", hashlib.sha256(url.encode()).hexdigest())
+        meta_path = part + ".json"
+        meta = _read_json(meta_path, {})
+        have = os.path.getsize(part) if os.path.exists(part) else 0
+        req = urllib.request.Request(url, headers={"User-Agent": "ecociencia-data-cache"})
+        if have and meta.get("validator"):
+            req.add_header("Range", f"bytes={have}-")
+            req.add_header("If-Range", meta["validator"])
+        try:
+            r = urllib.request.urlopen(req, timeout=self.timeout)
+        except urllib.error.HTTPError as e:
+            if e.code != 416:
+                raise
+            # El parcial ya estaba completo (se cortó justo antes de moverlo a objects/)
+            with open(part, "rb") as f:
+                return part, f.read(512)
+        with r:
+            resumed = r.status == 206
+            if not resumed:
+                have = 0
+            validator = r.headers.get("ETag") or r.headers.get("Last-Modified")
+            total = r.headers.get("Content-Range", "").rpartition("/")[2] if resumed else r.headers.get("Content-Length")
+            _write_json(meta_path, {"url": url, "validator": validator})
+            with open(part, "ab" if resumed else "wb") as f:
+                first = True
+                while True:
+                    block = r.read(CHUNK)
+                    if not block:
+                        break
+                    if first and not resumed:
+                        # Formato validado con el primer bloque, sin esperar al archivo completo
+                        if not block.startswith(LFS_POINTER):
+                            validate(block[:64], name)
+                        first = False
+                    f.write(block)
+                    have += len(block)
+        if total and total.isdigit() and have < int(total):
+            # Lo recibido queda en partial/ y la próxima llamada continúa desde ahí
+            raise OSError(f"{name}: descarga incompleta ({have} de {total} bytes)")
+        with open(part, "rb") as f:
+            head = f.read(512)
+        if self.log:
+            self.log(f"{name}: {have / 2**20:.1f} MB{' (reanudado)' if resumed else ''}")
+        return part, head
+
+    def fetch(self, url, dest=None, sha256=None, refresh=False):
+        # Ruta local del contenido de url; dest (opcional) es la ruta donde dejarlo con su nombre
+        url = to_raw(url)
+        name = os.path.basename(url.split("?")[0])
+        record = None if refresh else self.lookup(url)
+        if record and sha256 and record["sha256"] != sha256:
+            record = None
+        if record is None:
+            if self.offline:
+                raise FileNotFoundError(f"{url} no está en la caché ({self.root}) y el modo sin conexión está activo")
+            record = self._fetch_remote(url, name, sha256)
+        obj = self._object(record["sha256"])
+        if dest is None:
+            dest = os.path.join(self.root, "files", record["sha256"][:16], name)
+        return _link(obj, str(dest))
+
+    def _fetch_remote(self, url, name, sha256=None):
+        part, head = self._download(url, name)
+        source = url
+        if head.startswith(LFS_POINTER):
+            # Puntero LFS: se baja el archivo real y se verifica contra el oid del puntero
+            media, oid = to_media(url), lfs_oid(head)
+            os.remove(part)
+            if media is None:
+                raise ValueError(f"{name}: {url} devolvió un puntero de Git LFS")
+            part, head = self._download(media, name)
+            sha256, source = sha256 or oid, media
+        validate(head, name)
+        digest = file_digest(part)
+        if sha256 and digest != sha256:
+            os.remove(part)
+            raise ValueError(f"{name}: SHA-256 {digest} no coincide con el esperado {sha256}")
+        os.replace(part, self._object(digest))
+        if os.path.exists(part + ".json"):
+            os.remove(part + ".json")
+        record = {"sha256": digest, "bytes": os.path.getsize(self._object(digest)), "source": source, "fetched": time.time()}
+        self._remember(url, record)
+        return record
+
+    def fetch_shapefile(self, url_shp, dest_dir=None, parts=SHAPEFILE_PARTS, required=SHAPEFILE_REQUIRED, workers=4):
+        # Descarga en paralelo los archivos hermanos de un shapefile y los deja juntos con el
+        # mismo nombre base; devuelve la ruta del .shp. Faltar un opcional (.cpg, .qix, ...) no es error.
+        url_shp = to_raw(url_shp)
+        stem = os.path.basename(url_shp)[:-4]
+        dest_dir = dest_dir or os.path.join(self.root, "files", hashlib.sha256(url_shp.encode()).hexdigest()[:16])
+
+        def one(ext):
+            try:
+                return ext, self.fetch(url_shp[:-4] + ext, os.path.join(dest_dir, stem + ext)), None
+            except (OSError, ValueError) as e:
+                return ext, None, e
+
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            results = {ext: (path, err) for ext, path, err in pool.map(one, parts)}
+        missing = [ext for ext in required if results[ext][0] is None]
+        if missing:
+            detail = "; ".join(f"{ext}: {results[ext][1]}" for ext in missing)
+            raise FileNotFoundError(f"Shapefile incompleto ({stem}). Faltan {', '.join(missing)} ({detail})")
+        return results[".shp"][0]
+
+    def entries(self):
+        return _read_json(self.index_path, {})
+
+    def size(self):
+        base = os.path.join(self.root, "objects")
+        return sum(os.path.getsize(os.path.join(base, f)) for f in os.listdir(base))
+
+    def clear(self):
+        shutil.rmtree(self.root, ignore_errors=True)
+        self.__init__(self.root, self.offline, self.timeout, self.log)
+
+_default = None
+
+def default_cache():
+    global _default
+    if _default is None:
+        _default = DataCache()
+    return _default
+
+def fetch(url, dest=None, sha256=None, refresh=False):
+    return default_cache().fetch(url, dest, sha256, refresh)
+
+def fetch_shapefile(url_shp, dest_dir=None, workers=4):
+    return default_cache().fetch_shapefile(url_shp, dest_dir, workers=workers)
+
+def main(argv=None):
+    p = argparse.ArgumentParser(description="Caché de descargas compartido por los notebooks de ecociencia.")
+    p.add_argument("command", choices=["fetch", "shapefile", "info", "clear"])
+    p.add_argument("urls", nargs="*")
+    p.add_argument("-o", "--output", help="Con fetch: ruta de destino (un solo URL); con shapefile: carpeta")
+    p.add_argument("--dir", default=DEFAULT_ROOT, help="Directorio de la caché (por defecto $ECOCIENCIA_CACHE o ~/.cache/ecociencia)")
+    p.add_argument("--offline", action="store_true", help="No usar la red: falla si algo no está en la caché")
+    args = p.parse_args(argv)
+    cache = DataCache(args.dir, offline=args.offline or OFFLINE, log=print)
+    if args.command == "fetch":
+        for url in args.urls:
+            print(cache.fetch(url, args.output if len(args.urls) == 1 else None))
+    elif args.command == "shapefile":
+        for url in args.urls:
+            print(cache.fetch_shapefile(url, args.output))
+    elif args.command == "info":
+        for url, r in sorted(cache.entries().items()):
+            print(f"{r['sha256'][:12]}  {r['bytes'] / 2**20:8.1f} MB  {url}")
+        print(f"{cache.size() / 2**20:.1f} MB en {args.dir}")
+    else:
+        cache.clear()
+        print(f"Caché vaciada: {args.dir}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,115 @@
+import hashlib, os, threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import pytest
+import data_cache
+from data_cache import DataCache
+
+GPKG = b"SQLite format 3\x00" + os.urandom(3 * 2**20)
+TIF = b"II*\x00" + os.urandom(2**16)
+SHP = b"\x00\x00\x27\x0a" + os.urandom(1000)
+HTML = b"<!DOCTYPE html><html><body>Not Found</body></html>"
+
+class Handler(BaseHTTPRequestHandler):
+    # Servidor de archivos con ETag, Range/If-Range y cortes simulados a mitad de la respuesta
+    files, cut, requests = {}, {}, []
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        self.requests.append((self.path, self.headers.get("Range")))
+        body = self.files.get(self.path)
+        if body is None:
+            self.send_error(404)
+            return
+        etag = f'"{hashlib.sha256(body).hexdigest()[:16]}"'
+        start, rng = 0, self.headers.get("Range")
+        if rng and self.headers.get("If-Range") in (None, etag):
+            start = int(rng.split("=")[1].split("-")[0])
+            if start >= len(body):
+                self.send_response(416)
+                self.send_header("Content-Range", f"bytes */{len(body)}")
+                self.end_headers()
+                return
+            self.send_response(206)
+            self.send_header("Content-Range", f"bytes {start}-{len(body) - 1}/{len(body)}")
+        else:
+            self.send_response(200)
+        self.send_header("ETag", etag)
+        self.send_header("Content-Length", str(len(body) - start))
+        self.end_headers()
+        n = self.cut.pop(self.path, None)
+        self.wfile.write(body[start:] if n is None else body[start:start + n])
+
+@pytest.fixture
+def server():
+    Handler.files, Handler.cut, Handler.requests = {}, {}, []
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield httpd, f"http://127.0.0.1:{httpd.server_address[1]}"
+    httpd.shutdown()
+    httpd.server_close()
+
+def read(path):
+    with open(path, "rb") as f:
+        return f.read()
+
+def test_resumes_interrupted_download(server, tmp_path):
+    _, base = server
+    Handler.files["/d/basins.gpkg"] = GPKG
+    Handler.cut["/d/basins.gpkg"] = 3 * 2**19
+    cache = DataCache(str(tmp_path / "cache"))
+    with pytest.raises(OSError):
+        cache.fetch(base + "/d/basins.gpkg")
+    path = cache.fetch(base + "/d/basins.gpkg", tmp_path / "basins.gpkg")
+    assert read(path) == GPKG
+    first, second = Handler.requests
+    assert first[1] is None and second[1] == f"bytes={3 * 2**19}-"
+
+def test_resolves_lfs_pointer(server, tmp_path, monkeypatch):
+    _, base = server
+    oid = hashlib.sha256(TIF).hexdigest()
+    Handler.files["/o/r/main/cobertura.tif"] = (f"version https://git-lfs.github.com/spec/v1\n"
+                                                f"oid sha256:{oid}\nsize {len(TIF)}\n").encode()
+    Handler.files["/media/o/r/main/cobertura.tif"] = TIF
+    monkeypatch.setattr(data_cache, "to_media", lambda url: url.replace(base + "/", base + "/media/"))
+    cache = DataCache(str(tmp_path / "cache"))
+    assert read(cache.fetch(base + "/o/r/main/cobertura.tif")) == TIF
+    record = cache.lookup(base + "/o/r/main/cobertura.tif")
+    assert record["sha256"] == oid and record["source"] == base + "/media/o/r/main/cobertura.tif"
+
+@pytest.mark.parametrize("name", ["basins.gpkg", "datos.zip"])
+def test_rejects_html_page(server, tmp_path, name):
+    _, base = server
+    Handler.files[f"/d/{name}"] = HTML
+    cache = DataCache(str(tmp_path / "cache"))
+    with pytest.raises(ValueError):
+        cache.fetch(f"{base}/d/{name}")
+    assert cache.lookup(f"{base}/d/{name}") is None
+    assert os.listdir(tmp_path / "cache" / "objects") == []
+
+def test_fetches_shapefile_parts(server, tmp_path):
+    _, base = server
+    parts = {".shp": SHP, ".shx": SHP[:200], ".dbf": b"\x03" + os.urandom(300), ".prj": b'GEOGCS["WGS 84"]'}
+    for ext, body in parts.items():
+        Handler.files[f"/s/Cuencas_n5{ext}"] = body
+    cache = DataCache(str(tmp_path / "cache"))
+    shp = cache.fetch_shapefile(base + "/s/Cuencas_n5.shp", str(tmp_path / "shp"), workers=4)
+    assert shp == str(tmp_path / "shp" / "Cuencas_n5.shp")
+    for ext, body in parts.items():
+        assert read(tmp_path / "shp" / f"Cuencas_n5{ext}") == body
+    # Las partes opcionales que faltan (.cpg, .qix, .fix) no son error; las obligatorias sí
+    del Handler.files["/s/Cuencas_n5.dbf"]
+    with pytest.raises(FileNotFoundError):
+        DataCache(str(tmp_path / "otra")).fetch_shapefile(base + "/s/Cuencas_n5.shp", str(tmp_path / "shp2"))
+
+def test_offline_cache_hits(server, tmp_path):
+    httpd, base = server
+    Handler.files["/d/basins.gpkg"] = GPKG
+    DataCache(str(tmp_path / "cache")).fetch(base + "/d/basins.gpkg")
+    httpd.shutdown()
+    offline = DataCache(str(tmp_path / "cache"), offline=True)
+    assert read(offline.fetch(base + "/d/basins.gpkg", tmp_path / "copia.gpkg")) == GPKG
+    with pytest.raises(FileNotFoundError):
+        offline.fetch(base + "/d/otro.gpkg")